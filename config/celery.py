@@ -1,7 +1,12 @@
 
 import os
+from contextlib import contextmanager
+
 from celery import Celery
 
+# Метрики задач: ожидание в очереди, время выполнения, ошибки и повторы
+from config import task_metrics  # noqa: F401
+
 # Установка переменной окружения для настроек проекта
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -13,3 +18,23 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Автоматическое обнаружение и регистрация задач из файлов tasks.py в приложениях Django
 app.autodiscover_tasks()
+
+
+@contextmanager
+def use_broker_url(url):
+    """
+    Направляет подключения к брокеру в адрес url, например memory:// для
+    замеров. Адрес задается переменной окружения CELERY_BROKER_URL, которую
+    Celery читает раньше настроек. Пулы соединений и продюсеров приложения
+    запоминают адрес при первой публикации задачи, поэтому блок открывается
+    в начале команды, до нее.
+    """
+    previous = os.environ.get('CELERY_BROKER_URL')
+    os.environ['CELERY_BROKER_URL'] = url
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('CELERY_BROKER_URL', None)
+        else:
+            os.environ['CELERY_BROKER_URL'] = previous
@@ -0,0 +1,228 @@
+import bisect
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Счетчик с метками в формате Prometheus.
+
+    Атрибуты:
+        name (str): Имя метрики.
+        documentation (str): Описание метрики.
+        labelnames (tuple): Имена меток.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}_total{format_labels(self.labelnames, labels)} {format_value(value)}'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин в формате Prometheus.
+
+    Атрибуты:
+        name (str): Имя метрики.
+        documentation (str): Описание метрики.
+        labelnames (tuple): Имена меток.
+        buckets (tuple): Верхние границы корзин по возрастанию.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            counts[0][index] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def collect(self):
+        with self._lock:
+            values = sorted((labels, (buckets[:], count, total))
+                            for labels, (buckets, count, total) in self._values.items())
+        for labels, (buckets, count, total) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), buckets):
+                cumulative += bucket
+                yield (f'{self.name}_bucket{format_labels(self.labelnames, labels, [("le", bound)])} '
+                       f'{cumulative}')
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {count}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Registry:
+    """
+    Набор метрик процесса, отдаваемый эндпоинтом метрик.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+registry = Registry()
+
+
+def histogram(name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def is_metrics_token_valid(authorization):
+    """
+    Проверяет заголовок Authorization: Bearer <METRICS_AUTH_TOKEN>.
+    Без заданного токена проверка не проходит.
+    """
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', None)
+    return bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+
+
+# Время по категориям (db, serialize) внутри текущего запроса
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Накопитель времени и количества операций по категориям для одного запроса.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.active = set()
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+@contextmanager
+def collect_timings():
+    """
+    Включает накопление времени операций для кода внутри блока.
+    """
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def pause_timings():
+    """
+    Исключает операции внутри блока из замеров текущего запроса, например
+    служебные запросы профилировщика.
+    """
+    token = _timings.set(None)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+
+
+def add_timing(name, seconds):
+    """
+    Добавляет время операции к текущему запросу; вне collect_timings ничего не делает.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def measure(name):
+    """
+    Замеряет блок кода как операцию name текущего запроса. Вложенные замеры
+    той же категории не учитываются повторно.
+    """
+    timings = _timings.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.add(name, time.perf_counter() - started)
@@ -0,0 +1,176 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+
+from config.metrics import COUNT_BUCKETS, add_timing, collect_timings, histogram, measure
+from config.profiling import MODE_CPROFILE, MODE_SAMPLE, profile_request, save_report
+from users.authentication import JWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_HEADER = 'X-Profile'
+
+REQUEST_DURATION = histogram('http_request_duration_seconds', 'Время обработки запроса представлением',
+                             ('view', 'method', 'status'))
+REQUEST_DB_QUERIES = histogram('http_request_db_queries', 'Количество SQL-запросов на запрос', ('view',),
+                               COUNT_BUCKETS)
+REQUEST_DB_DURATION = histogram('http_request_db_duration_seconds', 'Время SQL-запросов на запрос', ('view',))
+REQUEST_SERIALIZE_DURATION = histogram('http_request_serialize_duration_seconds',
+                                       'Время сериализации и рендеринга ответа', ('view',))
+
+
+def get_view_name(request):
+    """
+    Возвращает имя обработавшего запрос представления: для ViewSet -
+    класс и действие (CourseViewSet.list), для APIView - класс.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if view_class is None:
+        return f'{func.__module__}.{func.__qualname__}'
+    action = (getattr(func, 'actions', None) or {}).get(request.method.lower())
+    return f'{view_class.__name__}.{action}' if action else view_class.__name__
+
+
+def measured_property(prop, name):
+    def getter(self):
+        with measure(name):
+            return prop.fget(self)
+    getter.measured = True
+    return property(getter)
+
+
+def instrument_drf():
+    """
+    Включает замер времени сериализации: свойства Serializer.data
+    и Response.rendered_content засчитываются в категорию serialize.
+
+    DRF не дает точки расширения для замера сериализации, поэтому свойства
+    заменяются на уровне классов BaseSerializer и Response (monkey patching)
+    один раз при создании RequestMetricsMiddleware и действуют во всем процессе.
+    Вне замеряемого запроса обертка только проверяет contextvar, поэтому
+    поведение и результат свойств не меняются. Повторный вызов ничего не
+    делает; при обновлении DRF проверьте, что эти свойства остались
+    свойствами класса с теми же именами.
+    """
+    for cls, attribute in ((BaseSerializer, 'data'), (Response, 'rendered_content')):
+        prop = cls.__dict__[attribute]
+        if not getattr(prop.fget, 'measured', False):
+            setattr(cls, attribute, measured_property(prop, 'serialize'))
+
+
+def time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        add_timing('db', time.perf_counter() - started)
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет для доли запросов REQUEST_METRICS_SAMPLE_RATE общее время,
+    количество и время SQL-запросов, время сериализации и запросов к Stripe.
+
+    Значения добавляются в гистограммы по имени представления и, если
+    SERVER_TIMING_HEADER, возвращаются клиенту в заголовке Server-Timing.
+    Невыбранные запросы обрабатываются без замеров.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Подменяет свойства DRF для замера сериализации, см. instrument_drf
+        instrument_drf()
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.1)
+        if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with collect_timings() as timings, connection.execute_wrapper(time_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = get_view_name(request)
+        REQUEST_DURATION.observe((view, request.method, response.status_code), duration)
+        REQUEST_DB_QUERIES.observe((view,), timings.counts.get('db', 0))
+        REQUEST_DB_DURATION.observe((view,), timings.seconds.get('db', 0.0))
+        REQUEST_SERIALIZE_DURATION.observe((view,), timings.seconds.get('serialize', 0.0))
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            entries = [
+                f'app;dur={duration * 1000:.2f}',
+                f'db;dur={timings.seconds.get("db", 0.0) * 1000:.2f};desc="{timings.counts.get("db", 0)} queries"',
+                f'serialize;dur={timings.seconds.get("serialize", 0.0) * 1000:.2f}',
+            ]
+            response['Server-Timing'] = ', '.join(entries)
+        return response
+
+
+def is_staff_request(request):
+    """
+    Проверяет, что запрос выполняет сотрудник: по сессии или по JWT-токену.
+    Токен проверяется здесь, потому что DRF аутентифицирует запрос только
+    внутри представления.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class RequestProfilerMiddleware:
+    """
+    Профилирует отдельные запросы: дерево вызовов, SQL-запросы с планами
+    EXPLAIN самых медленных из них и выделения памяти. Отчет сохраняется
+    в хранилище profiles и доступен сотрудникам по /profiles/<id>/.
+
+    Сотрудник включает профилирование параметром ?profile= или заголовком
+    X-Profile: значение cprofile выбирает детерминированный профилировщик,
+    любое другое - статистический; id отчета возвращается в X-Profile-Id.
+    Кроме того, доля PROFILE_SAMPLE_RATE остальных запросов профилируется
+    в фоне статистическим профилировщиком без учета выделений памяти.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        flag = request.GET.get(PROFILE_QUERY_PARAM) or request.headers.get(PROFILE_HEADER)
+        if flag and is_staff_request(request):
+            mode = MODE_CPROFILE if flag == MODE_CPROFILE else MODE_SAMPLE
+            response, report = profile_request(request, self.get_response, mode, True, 'request')
+            if report is not None:
+                self.save(request, report)
+                response['X-Profile-Id'] = report['id']
+                response['X-Profile-Url'] = reverse('profile-report', args=[report['id']])
+            return response
+
+        sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if sample_rate > 0 and random.random() < sample_rate:
+            response, report = profile_request(request, self.get_response, MODE_SAMPLE, False, 'sample')
+            if report is not None:
+                self.save(request, report)
+            return response
+        return self.get_response(request)
+
+    def save(self, request, report):
+        report['view'] = get_view_name(request)
+        save_report(report)
+        logger.info('Profiled %s %s (%s): report %s', report['method'], report['path'], report['view'], report['id'])
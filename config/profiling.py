@@ -0,0 +1,335 @@
+import cProfile
+import json
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from config.metrics import pause_timings
+
+MODE_SAMPLE = 'sample'
+MODE_CPROFILE = 'cprofile'
+
+# Одновременно профилируется только один запрос процесса: cProfile
+# и tracemalloc глобальны, параллельные замеры искажали бы друг друга
+_profile_lock = threading.Lock()
+
+
+def frame_name(code):
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """
+    Статистический профилировщик одного потока: фоновый поток каждые
+    interval секунд снимает стек профилируемого потока и добавляет его
+    в дерево вызовов. Накладные расходы не зависят от количества вызовов.
+
+    Атрибуты:
+        interval (float): Интервал между снимками стека в секундах.
+        samples (int): Количество снятых стеков.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = 0
+        self._root = {'samples': 0, 'children': {}}
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_id = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.samples += 1
+            node = self._root
+            for code in reversed(stack):
+                node = node['children'].setdefault(frame_name(code), {'samples': 0, 'children': {}})
+                node['samples'] += 1
+
+    def call_tree(self, min_share=0.01):
+        """
+        Возвращает дерево вызовов без узлов, встретившихся менее чем
+        в доле min_share снимков.
+        """
+        threshold = max(1, self.samples * min_share)
+
+        def convert(children):
+            nodes = sorted(children.items(), key=lambda item: item[1]['samples'], reverse=True)
+            return [
+                {
+                    'function': name,
+                    'samples': node['samples'],
+                    'ms': round(node['samples'] * self.interval * 1000, 1),
+                    'children': convert(node['children']),
+                }
+                for name, node in nodes if node['samples'] >= threshold
+            ]
+
+        return {'interval_ms': self.interval * 1000, 'samples': self.samples, 'tree': convert(self._root['children'])}
+
+
+class DeterministicProfiler:
+    """
+    Детерминированный профилировщик на cProfile: точное количество вызовов
+    и время каждой функции ценой замедления кода с большим числом вызовов.
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def call_tree(self, limit=40, callees=10):
+        """
+        Возвращает limit функций с наибольшим временем с учетом вложенных
+        вызовов и для каждой - callees самых дорогих вызываемых функций.
+        """
+        stats = pstats.Stats(self._profile).stats
+        children = {}
+        for function, (_, _, _, _, callers) in stats.items():
+            for caller, (_, calls, _, cumulative) in callers.items():
+                children.setdefault(caller, []).append((cumulative, calls, function))
+
+        def name(function):
+            filename, line, func = function
+            return f'{func} ({filename}:{line})'
+
+        top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return {
+            'functions': [
+                {
+                    'function': name(function),
+                    'calls': calls,
+                    'own_ms': round(own * 1000, 3),
+                    'cumulative_ms': round(cumulative * 1000, 3),
+                    'callees': [
+                        {'function': name(callee), 'calls': callee_calls,
+                         'cumulative_ms': round(callee_cumulative * 1000, 3)}
+                        for callee_cumulative, callee_calls, callee
+                        in sorted(children.get(function, []), reverse=True)[:callees]
+                    ],
+                }
+                for function, (_, calls, own, cumulative, _) in top
+            ],
+        }
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL, сохраняющая текст, параметры и время запросов.
+    Параметры нужны только для EXPLAIN и в отчет не попадают: в них бывают
+    персональные данные, пароли и токены.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, None if many else params, time.perf_counter() - started))
+
+    def explain(self, sql, params):
+        """
+        Возвращает план выполнения запроса. EXPLAIN выполняется только для
+        SELECT, чтобы не повторять изменяющие данные запросы.
+        """
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return None
+        options = {'analyze': True} if getattr(settings, 'PROFILE_EXPLAIN_ANALYZE', False) else {}
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix(**options)} {sql}', params)
+                return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+        except DatabaseError as error:
+            return f'EXPLAIN failed: {error}'
+
+    def report(self, explain_count):
+        """
+        Возвращает сводку запросов с планами explain_count самых медленных.
+        EXPLAIN не учитывается в метриках запроса (RequestMetricsMiddleware).
+        """
+        slowest = sorted(self.queries, key=lambda query: query[2], reverse=True)[:explain_count]
+        repeated = Counter(sql for sql, _, _ in self.queries).most_common(10)
+        with pause_timings():
+            plans = [self.explain(sql, params) for sql, params, _ in slowest]
+        return {
+            'count': len(self.queries),
+            'total_ms': round(sum(seconds for _, _, seconds in self.queries) * 1000, 3),
+            'slowest': [
+                {'sql': sql, 'ms': round(seconds * 1000, 3), 'plan': plan}
+                for (sql, _, seconds), plan in zip(slowest, plans)
+            ],
+            'repeated': [{'sql': sql, 'count': count} for sql, count in repeated if count > 1],
+        }
+
+
+class AllocationTracker:
+    """
+    Статистика выделений памяти через tracemalloc: пик и строки кода,
+    выделившие больше всего памяти, которая жива на момент окончания запроса.
+    """
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self._owner = False
+
+    def start(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(self.frames)
+            self._owner = True
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self, limit=20):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if self._owner:
+            tracemalloc.stop()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        statistics = snapshot.filter_traces(filters).compare_to(self._baseline.filter_traces(filters), 'lineno')
+        return {
+            'peak_kb': round(peak / 1024, 1),
+            'current_kb': round(current / 1024, 1),
+            'top': [
+                {'location': str(stat.traceback), 'size_kb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff}
+                for stat in statistics[:limit] if stat.size_diff > 0
+            ],
+        }
+
+
+def time_ordered_uuid():
+    """
+    Возвращает UUID версии 7: старшие 48 бит - время создания в миллисекундах,
+    поэтому имена файлов отчетов сортируются по времени без чтения их атрибутов.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | random.getrandbits(80)
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+
+def uuid_created(value):
+    """
+    Возвращает время создания UUID версии 7 или None для других версий.
+    """
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=dt_timezone.utc)
+
+
+def list_reports():
+    """
+    Возвращает id сохраненных отчетов, новые первыми. Отчеты со случайными
+    id (сохраненные до перехода на UUID версии 7) считаются самыми старыми.
+    """
+    try:
+        _, files = storages['profiles'].listdir('')
+    except FileNotFoundError:
+        return []
+    report_ids = (name.removesuffix('.json') for name in files if name.endswith('.json'))
+    return sorted(report_ids, key=lambda report_id: (uuid.UUID(report_id).version == 7, report_id), reverse=True)
+
+
+def purge_reports(keep):
+    """
+    Удаляет отчеты, кроме keep последних. Возвращает количество удаленных.
+    """
+    storage = storages['profiles']
+    expired = list_reports()[keep:]
+    for report_id in expired:
+        storage.delete(f'{report_id}.json')
+    return len(expired)
+
+
+def save_report(report):
+    """
+    Сохраняет отчет в хранилище profiles и возвращает его id. В хранилище
+    остаются только PROFILE_REPORTS_MAX_COUNT последних отчетов.
+    """
+    storages['profiles'].save(f'{report["id"]}.json', ContentFile(
+        json.dumps(report, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    ))
+    purge_reports(getattr(settings, 'PROFILE_REPORTS_MAX_COUNT', 200))
+    return report['id']
+
+
+def profile_request(request, get_response, mode, allocations, trigger):
+    """
+    Обрабатывает запрос под профилировщиком mode, записывая SQL-запросы
+    и, если allocations, выделения памяти. Возвращает ответ и несохраненный
+    отчет, или ответ и None, если в процессе уже профилируется другой запрос.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return get_response(request), None
+    try:
+        if mode == MODE_CPROFILE:
+            profiler = DeterministicProfiler()
+        else:
+            profiler = SamplingProfiler(getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005))
+        tracker = AllocationTracker() if allocations else None
+        recorder = QueryRecorder()
+
+        if tracker is not None:
+            tracker.start()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = get_response(request)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - started
+            allocation_stats = tracker.stop() if tracker is not None else None
+    finally:
+        _profile_lock.release()
+
+    report = {
+        'id': str(time_ordered_uuid()),
+        'created': timezone.now(),
+        'trigger': trigger,
+        'mode': mode,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'call_tree': profiler.call_tree(),
+        'sql': recorder.report(getattr(settings, 'PROFILE_EXPLAIN_STATEMENTS', 5)),
+        'allocations': allocation_stats,
+    }
+    return response, report
@@ -14,6 +14,7 @@ from pathlib import Path
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
+from kombu import Queue
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,7 +27,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ["*"]
 
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,10 +60,29 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+# Доля запросов, для которых собираются метрики (0 - замеры отключены),
+# заголовок Server-Timing в ответах, токен доступа к /metrics/ и открытый
+# доступ к метрикам без токена (по умолчанию - только с токеном или сотрудникам)
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv('REQUEST_METRICS_SAMPLE_RATE', 0.1))
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'True') == 'True'
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True'
+
+# Профилирование запросов: доля запросов, профилируемых в фоне (0 - только
+# по флагу сотрудника), интервал снятия стека статистическим профилировщиком,
+# количество самых медленных SQL-запросов с планом EXPLAIN, EXPLAIN ANALYZE
+# и количество хранимых отчетов (более старые удаляются при сохранении нового)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_EXPLAIN_STATEMENTS = 5
+PROFILE_EXPLAIN_ANALYZE = False
+PROFILE_REPORTS_MAX_COUNT = 200
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -135,6 +156,20 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Отчеты профилировщика хранятся отдельно от MEDIA, чтобы не раздаваться как статика
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'profiles': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': BASE_DIR / 'profiles'},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -150,11 +185,19 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 SERVER_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Количество адресатов в одной задаче рассылки об обновлении курса
+COURSE_UPDATE_EMAIL_CHUNK_SIZE = 500
+# Окно, в течение которого обновления курса объединяются в одно уведомление.
+# Объединение держится на ключе в CACHES['default'] и работает между процессами
+# только с общим кэшем (CACHE_REDIS_URL); с LocMemCache каждый процесс
+# веб-сервера ставит свою задачу, и подписчики получают по письму от каждого
+COURSE_UPDATE_EMAIL_WINDOW = timedelta(minutes=5)
+
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -164,10 +207,47 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=1000),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.UserTokenObtainPairSerializer',
 }
 
+# Брать роли пользователя из claim access-токена вместо запроса к группам.
+# Изменения групп вступают в силу только после выпуска нового токена.
+ROLES_FROM_TOKEN = os.getenv('ROLES_FROM_TOKEN', 'False') == 'True'
+
+# Собирать пользователя из claims access-токена без запроса к базе.
+# Активность пользователя перепроверяется не реже раза в USER_ACTIVE_CHECK_TTL секунд.
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'False') == 'True'
+USER_ACTIVE_CHECK_TTL = 60
+
 
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
+STRIPE_SUCCESS_URL = 'http://127.0.0.1:8000/courses/'
+STRIPE_CANCEL_URL = 'http://127.0.0.1:8000/courses/'
+
+# HTTP-клиент Stripe: размер пула keep-alive соединений, таймауты (секунды)
+# и повторы с экспоненциальной паузой от STRIPE_RETRY_DELAY до STRIPE_RETRY_MAX_DELAY
+STRIPE_HTTP_POOL_SIZE = int(os.getenv('STRIPE_HTTP_POOL_SIZE', 10))
+STRIPE_CONNECT_TIMEOUT = 5
+STRIPE_READ_TIMEOUT = 30
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', 2))
+STRIPE_RETRY_DELAY = 0.5
+STRIPE_RETRY_MAX_DELAY = 4
+
+# Вебхуки Stripe: секрет подписи, допустимый возраст подписи (секунды),
+# окно объединения событий в одну задачу обработки и размер пачки.
+# Окно держится на ключе в CACHES['default'] и объединяет события всех
+# процессов только с общим кэшем (CACHE_REDIS_URL); с LocMemCache каждый
+# процесс ставит свою задачу, и они разбирают события параллельно
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+STRIPE_WEBHOOK_TOLERANCE = 300
+STRIPE_EVENTS_WINDOW = timedelta(seconds=2)
+STRIPE_EVENTS_BATCH_SIZE = 1000
+
+# Максимальное количество последних платежей, встраиваемых в пользователя при ?expand=payments
+USER_PAYMENTS_EMBED_LIMIT = 5
+
+# Интервал повторного запроса статуса платежа в статусе pending (Retry-After), секунды
+PAYMENT_STATUS_RETRY_AFTER = 1
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 
@@ -175,9 +255,118 @@ CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 
 CELERY_TIMEZONE = 'Asia/Almaty'
 
+# Очереди задач: рассылки, платежи и обслуживание обрабатываются разными
+# воркерами, чтобы большая рассылка не задерживала платежи и ночные задачи.
+# В celery остаются задачи без маршрута
+CELERY_TASK_QUEUES = [Queue(name, routing_key=name) for name in ('celery', 'email', 'payments', 'maintenance')]
+
+# Приоритет задачи внутри очереди. В брокере Redis 0 - наивысший, 9 - наименьший;
+# priority_steps задает все 10 уровней вместо четырех по умолчанию, а воркер
+# нескольких очередей выбирает их в порядке перечисления в -Q
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+
+CELERY_TASK_ROUTES = {
+    'courses.tasks.send_course_update_email': {'queue': 'email', 'priority': 3},
+    'courses.tasks.send_course_update_email_chunk': {'queue': 'email', 'priority': 6},
+    'users.tasks.create_payment_checkout_session': {'queue': 'payments', 'priority': 0},
+    'users.tasks.process_stripe_events': {'queue': 'payments', 'priority': 3},
+    'users.tasks.sync_stripe_catalog': {'queue': 'payments', 'priority': 6},
+    'courses.tasks.check_inactive_users': {'queue': 'maintenance', 'priority': 6},
+    'users.tasks.reconcile_payment_summaries': {'queue': 'maintenance', 'priority': 6},
+    'users.tasks.purge_stripe_events': {'queue': 'maintenance', 'priority': 9},
+}
+
+# Профили воркеров для команды run_worker: очереди, пул, количество
+# одновременных задач и множитель предвыборки. Рассылки ограничены вводом-выводом
+# и выполняются в eventlet, платежи - в потоках с предвыборкой по одной задаче,
+# чтобы приоритеты соблюдались, обслуживание - в отдельных процессах.
+# Каждая одновременная задача, обращающаяся к базе, держит свое соединение
+# с PostgreSQL: сумма concurrency всех воркеров и потоков веб-приложения должна
+# оставаться ниже max_connections (по умолчанию 100) с запасом, иначе нужен
+# пул соединений (PgBouncer в режиме transaction)
+WORKER_PROFILES = {
+    'email': {
+        'queues': ['email'],
+        'pool': 'eventlet',
+        'concurrency': 20,
+        'prefetch_multiplier': 4,
+    },
+    'payments': {
+        'queues': ['payments'],
+        'pool': 'threads',
+        'concurrency': 8,
+        'prefetch_multiplier': 1,
+    },
+    'maintenance': {
+        'queues': ['maintenance', 'celery'],
+        'pool': 'prefork',
+        'concurrency': 2,
+        'prefetch_multiplier': 1,
+        'max_tasks_per_child': 100,
+    },
+}
+
+# Порт HTTP-сервера метрик задач в процессе воркера (не задан - сервер не запускается)
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0)) or None
+
+# Максимальное количество уроков в одном запросе массового создания
+LESSON_BULK_CREATE_MAX_ITEMS = 5000
+
+# Максимальное количество курсов в одном запросе массовой подписки
+SUBSCRIPTION_BULK_MAX_ITEMS = 1000
+
+# Количество строк, читаемых курсором за раз при выгрузке платежей
+PAYMENT_EXPORT_CHUNK_SIZE = 2000
+
+# Размер диапазона id, обновляемого одним UPDATE в check_inactive_users
+INACTIVE_USERS_CHUNK_SIZE = 10000
+
 CELERY_BEAT_SCHEDULE = {
     'check_inactive_users': {
         'task': 'courses.tasks.check_inactive_users',
         'schedule': timedelta(days=1),
     },
+    'reconcile_payment_summaries': {
+        'task': 'users.tasks.reconcile_payment_summaries',
+        'schedule': timedelta(hours=6),
+    },
+    'purge_stripe_events': {
+        'task': 'users.tasks.purge_stripe_events',
+        'schedule': timedelta(days=1),
+    },
+    # Подбирает события, задача обработки которых потерялась (сбой брокера
+    # или воркера после записи события); выполняется в очереди payments
+    'process_stripe_events': {
+        'task': 'users.tasks.process_stripe_events',
+        'schedule': timedelta(minutes=1),
+    },
 }
+
+# Без CACHE_REDIS_URL кэш хранится в памяти каждого процесса: этого достаточно
+# для разработки и тестов, но в production с несколькими процессами не работают
+# общие для них ключи (объединение уведомлений об обновлении курса и
+# событий Stripe)
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кэш ответов курсов и уроков: память процесса (LRU) + CACHES['default']
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_LOCAL_MAXSIZE = 1024
+RESPONSE_CACHE_LOCAL_TIMEOUT = 30
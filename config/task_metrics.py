@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from billiard.process import current_process
+from celery import signals
+from django.conf import settings
+
+from config.metrics import counter, histogram, is_metrics_token_valid, registry
+
+logger = logging.getLogger(__name__)
+
+# Заголовок сообщения с временем постановки задачи в очередь (Unix time)
+PUBLISHED_AT_HEADER = 'published_at'
+
+TASKS_PUBLISHED = counter('celery_tasks_published', 'Количество задач, поставленных в очередь', ('task', 'queue'))
+TASK_QUEUE_WAIT = histogram('celery_task_queue_wait_seconds',
+                            'Время от постановки задачи в очередь (или ее ETA) до начала выполнения',
+                            ('task', 'queue'))
+TASK_RUNTIME = histogram('celery_task_runtime_seconds', 'Время выполнения задачи', ('task', 'state'))
+TASK_FAILURES = counter('celery_task_failures', 'Количество задач, завершившихся ошибкой', ('task', 'exception'))
+TASK_RETRIES = counter('celery_task_retries', 'Количество повторов задач', ('task',))
+
+# Время начала выполняющихся задач процесса по id задачи
+_started = {}
+
+
+def get_queue(request):
+    delivery_info = getattr(request, 'delivery_info', None) or {}
+    return delivery_info.get('routing_key') or 'celery'
+
+
+def get_queue_wait(request, now):
+    """
+    Возвращает время ожидания задачи в очереди: от публикации или, для
+    отложенных задач, от наступления ETA. None, если время публикации неизвестно.
+    """
+    # Воркер переносит заголовки сообщения в атрибуты запроса, apply() - в request.headers
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None) or (request.headers or {}).get(PUBLISHED_AT_HEADER)
+    if published_at is None:
+        return None
+    ready_at = float(published_at)
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready_at = max(ready_at, eta.timestamp())
+    return max(0.0, now - ready_at)
+
+
+@signals.before_task_publish.connect
+def on_before_task_publish(sender=None, headers=None, routing_key=None, **kwargs):
+    if headers is None:
+        return
+    headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+    TASKS_PUBLISHED.inc((sender, routing_key or 'celery'))
+
+
+@signals.task_prerun.connect
+def on_task_prerun(task_id=None, task=None, **kwargs):
+    queue_wait = get_queue_wait(task.request, time.time())
+    if queue_wait is not None:
+        TASK_QUEUE_WAIT.observe((task.name, get_queue(task.request)), queue_wait)
+    _started[task_id] = time.perf_counter()
+
+
+@signals.task_postrun.connect
+def on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.observe((task.name, state or 'UNKNOWN'), time.perf_counter() - started)
+
+
+@signals.task_failure.connect
+def on_task_failure(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.inc((sender.name, type(exception).__name__))
+
+
+@signals.task_retry.connect
+def on_task_retry(sender=None, **kwargs):
+    TASK_RETRIES.inc((sender.name,))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Отдает метрики процесса воркера в том же формате, что и /metrics/ веб-приложения.
+    Требуется заголовок Authorization: Bearer <METRICS_AUTH_TOKEN>, без него
+    метрики доступны только при METRICS_PUBLIC.
+    """
+
+    def do_GET(self):
+        if not (getattr(settings, 'METRICS_PUBLIC', False)
+                or is_metrics_token_valid(self.headers.get('Authorization', ''))):
+            self.send_response(403)
+            self.end_headers()
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port):
+    """
+    Запускает в фоновом потоке HTTP-сервер метрик на порту port.
+    """
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info('Serving worker metrics on port %s', port)
+    return server
+
+
+_server = None
+
+
+@signals.worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    # Задачи prefork-пула выполняются в дочерних процессах со своими метриками:
+    # процесс с номером N отдает их на WORKER_METRICS_PORT + 1 + N. Пул solo
+    # отправляет сигнал в основном процессе, он отдает метрики на основном порту
+    global _server
+    port = getattr(settings, 'WORKER_METRICS_PORT', None)
+    if not port:
+        return
+    index = getattr(current_process(), 'index', None)
+    if index is not None:
+        _server = serve_metrics(port + 1 + index)
+    elif _server is None:
+        _server = serve_metrics(port)
+
+
+@signals.worker_ready.connect
+def on_worker_ready(**kwargs):
+    global _server
+    port = getattr(settings, 'WORKER_METRICS_PORT', None)
+    if port and _server is None:
+        _server = serve_metrics(port)
@@ -22,6 +22,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from config.views import ProfileReportAPIView, ProfileReportListAPIView, metrics_view
+
 schema_view = get_schema_view(
    openapi.Info(
       title="Snippets API",
@@ -39,6 +41,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('courses.urls', namespace='courses')),
     path('users/', include('users.urls', namespace='users')),
+    path('metrics/', metrics_view, name='metrics'),
+    path('profiles/', ProfileReportListAPIView.as_view(), name='profile-reports'),
+    path('profiles/<uuid:report_id>/', ProfileReportAPIView.as_view(), name='profile-report'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,56 @@
+from uuid import UUID
+
+from django.conf import settings
+from django.core.files.storage import storages
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.urls import reverse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.metrics import is_metrics_token_valid, registry
+from config.middleware import is_staff_request
+from config.profiling import list_reports, uuid_created
+
+
+def metrics_view(request):
+    """
+    Отдает метрики процесса в текстовом формате Prometheus. Доступ есть
+    у запросов с заголовком Authorization: Bearer <METRICS_AUTH_TOKEN>
+    и у сотрудников; без проверки - только при METRICS_PUBLIC.
+    """
+    if not (getattr(settings, 'METRICS_PUBLIC', False)
+            or is_metrics_token_valid(request.headers.get('Authorization', ''))
+            or is_staff_request(request)):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileReportListAPIView(APIView):
+    """
+    Список последних отчетов профилировщика, новые первыми. Количество
+    хранимых отчетов ограничено PROFILE_REPORTS_MAX_COUNT, время создания
+    берется из id отчета.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response([
+            {'id': report_id, 'created': uuid_created(UUID(report_id)),
+             'url': request.build_absolute_uri(reverse('profile-report', args=[report_id]))}
+            for report_id in list_reports()[:100]
+        ])
+
+
+class ProfileReportAPIView(APIView):
+    """
+    Отдает сохраненный отчет профилировщика в формате JSON.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, report_id):
+        storage = storages['profiles']
+        name = f'{report_id}.json'
+        if not storage.exists(name):
+            raise Http404
+        return FileResponse(storage.open(name), content_type='application/json', filename=name)
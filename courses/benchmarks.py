@@ -0,0 +1,178 @@
+import math
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.serializers import UserTokenObtainPairSerializer
+
+# Метрики, по которым сравниваются прогоны: большее значение - хуже
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+class Scenario:
+    """
+    Сценарий нагрузки на один эндпоинт.
+
+    Атрибуты:
+        name (str): Имя сценария в отчете.
+        method (str): HTTP-метод.
+        path (callable): Функция (rng, dataset, user) -> путь запроса.
+        data (callable): Функция (rng, dataset, user) -> тело запроса или None.
+        expected (tuple): Коды ответа, считающиеся успешными.
+    """
+
+    def __init__(self, name, method, path, data=None, expected=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.expected = expected
+
+
+SCENARIOS = [
+    Scenario('courses.list', 'get', lambda rng, ds, user: '/courses/'),
+    Scenario('courses.list?expand=lessons', 'get', lambda rng, ds, user: '/courses/?expand=lessons'),
+    Scenario('courses.retrieve', 'get', lambda rng, ds, user: f'/courses/{rng.choice(ds.owned_courses[user.id])}/'),
+    Scenario('lesson.list', 'get', lambda rng, ds, user: '/lesson/'),
+    Scenario('lesson.list?pagination=cursor', 'get', lambda rng, ds, user: '/lesson/?pagination=cursor'),
+    Scenario('lesson.retrieve', 'get', lambda rng, ds, user: f'/lesson/{rng.choice(ds.lesson_ids)}/',
+             expected=(200, 403, 404)),
+    Scenario('subscription.create', 'post', lambda rng, ds, user: '/subscription/create/',
+             lambda rng, ds, user: {'course_id': rng.choice(ds.course_ids)}, expected=(201,)),
+    Scenario('users.payment.list', 'get', lambda rng, ds, user: '/users/payment/'),
+    Scenario('users.payment.create', 'post', lambda rng, ds, user: '/users/payment/create/',
+             lambda rng, ds, user: {'user': user.id, 'course': rng.choice(ds.course_ids), 'amount': '10.00',
+                                     'payment_method': 'transfer'},
+             expected=(201,)),
+    Scenario('users.list', 'get', lambda rng, ds, user: '/users/users/'),
+]
+
+
+def percentile(sorted_values, percent):
+    """
+    Возвращает перцентиль отсортированной выборки методом ближайшего ранга.
+    """
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(timings, queries, errors, elapsed):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / elapsed, 1),
+        'mean_ms': round(statistics.mean(timings) * 1000, 2),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+class LoadRunner:
+    """
+    Выполняет сценарии в текущем процессе конкурентными клиентами.
+
+    Каждый клиент работает в своем потоке со своим соединением с базой
+    данных и аутентифицируется JWT-токеном случайного пользователя набора
+    данных. Для каждого запроса замеряются время ответа и количество
+    SQL-запросов.
+
+    Атрибуты:
+        dataset: Объект с атрибутами user_ids (пользователи клиентов), course_ids,
+            lesson_ids и owned_courses (id пользователя -> id его курсов).
+        users (dict): id -> пользователь для выпуска токенов.
+        concurrency (int): Количество одновременных клиентов.
+        requests (int): Количество запросов на сценарий.
+        warmup (int): Количество неучитываемых запросов каждого клиента перед замером.
+        seed (int): Начальное значение генератора случайных чисел.
+    """
+
+    def __init__(self, dataset, users, concurrency=8, requests=200, warmup=5, seed=0):
+        self.dataset = dataset
+        self.users = users
+        self.concurrency = concurrency
+        self.requests = requests
+        self.warmup = warmup
+        self.seed = seed
+
+    def make_client(self, rng):
+        user = self.users[rng.choice(self.dataset.user_ids)]
+        client = APIClient()
+        token = UserTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client, user
+
+    def run_client(self, scenario, number, count, barrier):
+        rng = random.Random(f'{self.seed}-{scenario.name}-{number}')
+        client, user = self.make_client(rng)
+        timings, queries, errors = [], [], 0
+        try:
+            for _ in range(self.warmup):
+                self.send(client, user, scenario, rng)
+            barrier.wait()
+            for _ in range(count):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = self.send(client, user, scenario, rng)
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                errors += response.status_code not in scenario.expected
+        except BaseException:
+            barrier.abort()
+            raise
+        finally:
+            connection.close()
+        return timings, queries, errors
+
+    def send(self, client, user, scenario, rng):
+        data = scenario.data(rng, self.dataset, user) if scenario.data else None
+        return getattr(client, scenario.method)(scenario.path(rng, self.dataset, user), data)
+
+    def run(self, scenario):
+        counts = [self.requests // self.concurrency + (i < self.requests % self.concurrency)
+                  for i in range(self.concurrency)]
+        barrier = threading.Barrier(self.concurrency + 1)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.run_client, scenario, i, count, barrier) for i, count in enumerate(counts)]
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+            started = time.perf_counter()
+            results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+        timings = [value for result in results for value in result[0]]
+        queries = [value for result in results for value in result[1]]
+        return summarize(timings, queries, sum(result[2] for result in results), elapsed)
+
+
+def compare(results, baseline, budget):
+    """
+    Сравнивает результаты с базовым прогоном и возвращает список регрессий:
+    рост задержки больше чем на долю budget, падение RPS больше чем на долю
+    budget, рост количества SQL-запросов на запрос и появление ошибок.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if current[metric] > previous[metric] * (1 + budget):
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {current[metric]}')
+        if current['rps'] < previous['rps'] * (1 - budget):
+            regressions.append(f'{name}: rps {previous["rps"]} -> {current["rps"]}')
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f'{name}: queries_per_request {previous["queries_per_request"]} -> '
+                               f'{current["queries_per_request"]}')
+        if current['errors'] > previous['errors']:
+            regressions.append(f'{name}: errors {previous["errors"]} -> {current["errors"]}')
+    return regressions
@@ -0,0 +1,219 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.generics import get_object_or_404
+
+from users.permissions import get_user_roles
+
+VERSION_KEY_PREFIX = 'response-cache:version:'
+ENTRY_KEY_PREFIX = 'response-cache:entry:'
+
+
+class LocalLRUCache:
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с ограничением по количеству
+    записей и времени жизни. Используется как первый уровень перед Redis.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRUCache(
+    maxsize=getattr(settings, 'RESPONSE_CACHE_LOCAL_MAXSIZE', 1024),
+    timeout=getattr(settings, 'RESPONSE_CACHE_LOCAL_TIMEOUT', 30),
+)
+
+
+def get_versions(names):
+    """
+    Возвращает текущие версии по списку имен одним запросом к кэшу.
+    Отсутствующая версия инициализируется меткой времени, чтобы после
+    вытеснения ключа из Redis не совпасть со старыми записями.
+    """
+    keys = [VERSION_KEY_PREFIX + name for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    """
+    Инвалидирует все закэшированные ответы, зависящие от указанных версий.
+
+    Внутри транзакции версии увеличиваются еще раз после ее фиксации: иначе
+    параллельный запрос, прочитавший данные до фиксации, сохранил бы их
+    под уже новой версией.
+    """
+    increment_versions(names)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: increment_versions(names))
+
+
+def increment_versions(names):
+    for name in names:
+        key = VERSION_KEY_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_course(course_id):
+    bump_versions(f'course:{course_id}', 'course-list')
+
+
+def invalidate_lesson(lesson_id, course_id):
+    bump_versions(f'lesson:{lesson_id}', 'lesson-list')
+    invalidate_course(course_id)
+
+
+def invalidate_subscriptions(user_id):
+    bump_versions(f'subscriptions:{user_id}')
+
+
+def get_entry(key):
+    entry = local_cache.get(key)
+    if entry is None:
+        entry = cache.get(ENTRY_KEY_PREFIX + key)
+        if entry is not None:
+            local_cache.set(key, entry)
+    return entry
+
+
+def set_entry(key, entry):
+    local_cache.set(key, entry)
+    cache.set(ENTRY_KEY_PREFIX + key, entry, timeout=getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+class CachedResponseMixin:
+    """
+    Миксин для кэширования успешных ответов list/retrieve.
+
+    Ключ записи строится из версий объектов (get_cache_versions), формата
+    ответа, параметров запроса и, если cache_per_user, пользователя.
+    Версии увеличиваются сигналами сохранения и удаления моделей (courses.signals),
+    поэтому устаревшие записи больше не находятся ни в памяти процесса, ни
+    в Redis. Персональный ключ включает роли пользователя, так что смена групп
+    не отдает ответы, построенные для прежних ролей. Ответ снабжается строгим
+    ETag, и при совпадении If-None-Match возвращается 304.
+
+    Аутентификация и проверки разрешений выполняются до обращения к кэшу;
+    перед отдачей закэшированного retrieve объект заново проверяется
+    has_object_permission по get_permission_queryset.
+    """
+    cache_per_user = True
+
+    def get_cache_versions(self):
+        raise NotImplementedError('`get_cache_versions()` must be implemented.')
+
+    def get_response_cache_key(self, request):
+        parts = [
+            self.__class__.__name__,
+            getattr(self, 'action', None) or request.method,
+            request.accepted_renderer.format,
+            sorted(request.query_params.lists()),
+            get_versions(self.get_cache_versions()),
+        ]
+        if self.cache_per_user:
+            parts.append((request.user.pk, request.user.is_superuser, sorted(get_user_roles(request))))
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get_permission_queryset(self):
+        """
+        Возвращает QuerySet для проверки доступа к объекту перед отдачей
+        закэшированного ответа; достаточно полей, нужных разрешениям.
+        """
+        return self.get_queryset()
+
+    def check_cached_object_permissions(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = get_object_or_404(self.get_permission_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, obj)
+
+    def get_cached_response(self, request, handler, *args, check_hit=None, **kwargs):
+        if not getattr(settings, 'RESPONSE_CACHE_ENABLED', True):
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        entry = get_entry(key)
+        if entry is None:
+            request.response_cache_key = key
+            return handler(request, *args, **kwargs)
+        if check_hit is not None:
+            check_hit()
+        content, content_type, etag = entry
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super().retrieve, *args,
+                                        check_hit=self.check_cached_object_permissions, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.cache_per_user:
+            patch_vary_headers(response, ['Authorization'])
+        key = getattr(request, 'response_cache_key', None)
+        if key is None or response.status_code != 200:
+            return response
+        response.render()
+        etag = '"%s"' % hashlib.sha1(response.content).hexdigest()
+        set_entry(key, (response.content, response['Content-Type'], etag))
+        response['ETag'] = etag
+        if etag_matches(request, etag):
+            not_modified = HttpResponseNotModified()
+            not_modified['ETag'] = etag
+            return not_modified
+        return response
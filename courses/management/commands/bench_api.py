@@ -0,0 +1,115 @@
+import json
+import logging
+import platform
+from collections import defaultdict
+from types import SimpleNamespace
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from config.celery import app, use_broker_url
+from courses.benchmarks import SCENARIOS, LoadRunner, compare
+from courses.models import Course
+from users.models import User
+from users.synthetic_data import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер API в текущем процессе: создает отдельную базу данных, заполняет ее '
+            'синтетическими данными и нагружает эндпоинты конкурентными клиентами. Выводит p50/p95/p99, '
+            'RPS и количество SQL-запросов на запрос, с --baseline завершается ошибкой при регрессии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--lessons', type=int, default=1_000)
+        parser.add_argument('--subscriptions', type=int, default=5_000)
+        parser.add_argument('--payments', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=8, help='Количество одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5, help='Запросов каждого клиента перед замером')
+        parser.add_argument('--scenario', action='append', default=None,
+                            help='Выполнить только указанные сценарии (можно повторять)')
+        parser.add_argument('--no-response-cache', action='store_true', help='Отключить кэш ответов')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--budget', type=float, default=0.2,
+                            help='Допустимое ухудшение задержки и RPS относительно --baseline (доля)')
+
+    def handle(self, *args, **options):
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['scenario'] or scenario.name in options['scenario']]
+        if not scenarios:
+            raise CommandError(f'Неизвестные сценарии, доступны: {", ".join(s.name for s in SCENARIOS)}')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = False
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            # Задачи ставятся в очередь в памяти процесса и не выполняются;
+            # до этого блока команда не публикует задач
+            with use_broker_url('memory://'), override_settings(
+                RESPONSE_CACHE_ENABLED=not options['no_response_cache'],
+            ):
+                results = self.run(scenarios, options)
+        finally:
+            request_logger.setLevel(log_level)
+            app.conf.task_always_eager = always_eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                **{name: options[name] for name in (
+                    'users', 'courses', 'lessons', 'subscriptions', 'payments', 'seed',
+                    'concurrency', 'requests', 'warmup', 'no_response_cache',
+                )},
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+        else:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['budget'])
+            if regressions:
+                raise CommandError('Регрессия относительно базового прогона:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run(self, scenarios, options):
+        generator = SyntheticDataGenerator(seed=options['seed'], password_pool=1, processes=1, prefix='bench-')
+        generator.generate(users=options['users'], courses=options['courses'], lessons=options['lessons'],
+                           subscriptions=options['subscriptions'], payments=options['payments'])
+        # Клиенты работают от имени авторов курсов, чтобы списки и карточки их курсов были непустыми
+        owned_courses = defaultdict(list)
+        for course_id, owner_id in Course.objects.filter(id__in=generator.course_ids).values_list('id', 'owner_id'):
+            owned_courses[owner_id].append(course_id)
+        dataset = SimpleNamespace(user_ids=sorted(owned_courses), course_ids=generator.course_ids,
+                                  lesson_ids=generator.lesson_ids, owned_courses=owned_courses)
+        users = User.objects.in_bulk(dataset.user_ids)
+        runner = LoadRunner(dataset, users, concurrency=options['concurrency'], requests=options['requests'],
+                            warmup=options['warmup'], seed=options['seed'])
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = result = runner.run(scenario)
+            self.stderr.write(
+                f'{scenario.name}: p50={result["p50_ms"]}ms p95={result["p95_ms"]}ms p99={result["p99_ms"]}ms '
+                f'rps={result["rps"]} queries={result["queries_per_request"]} errors={result["errors"]}'
+            )
+        return results
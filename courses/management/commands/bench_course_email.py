@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from config.celery import app
+from courses.models import Course, Subscription
+from courses.tasks import send_course_update_email
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Замер рассылки об обновлении курса на locmem-бэкенде (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        subscribers = options['subscribers']
+        batch_size = options['batch_size']
+        password = make_password(None)
+
+        with transaction.atomic():
+            course = Course.objects.create(title='bench course')
+            users = User.objects.bulk_create(
+                (User(email=f'bench-{i}@example.com', password=password) for i in range(subscribers)),
+                batch_size=batch_size,
+            )
+            Subscription.objects.bulk_create(
+                (Subscription(user=user, course=course) for user in users),
+                batch_size=batch_size,
+            )
+
+            always_eager = app.conf.task_always_eager
+            app.conf.task_always_eager = True
+            try:
+                with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                    mail.outbox = []
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as queries:
+                        send_course_update_email(course.id)
+                    elapsed = time.perf_counter() - started
+                    sent = len(mail.outbox)
+            finally:
+                app.conf.task_always_eager = always_eager
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'subscribers={subscribers} messages={sent} queries={len(queries)} '
+            f'time={elapsed:.2f}s rate={sent / elapsed:.0f} msg/s'
+        )
@@ -0,0 +1,199 @@
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import force_authenticate
+
+from courses.models import Course, Lesson, Subscription
+from courses.tasks import get_inactive_users
+from courses.views import CourseViewSet, LessonListAPIView, LessonRetrieveAPIView
+from users.models import User, Payment
+from users.views import PaymentListAPIView, UserViewSet
+
+SEQ_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+# COUNT(*) постраничной пагинации без фильтров читает всю таблицу при любых индексах
+FULL_COUNT_RE = re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "(\w+)"$')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми данными, выполняет запросы основных эндпоинтов и задач '
+            'так же, как представления (get_queryset, фильтры, пагинация с COUNT(*)), делает '
+            'EXPLAIN каждого выполненного SQL-запроса и завершается ошибкой при Seq Scan '
+            'по большой таблице. COUNT(*) без фильтров по большой таблице выводится '
+            'предупреждением: его ускоряет только курсорная пагинация. Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--courses', type=int, default=1_000)
+        parser.add_argument('--lessons-per-course', type=int, default=10)
+        parser.add_argument('--subscriptions', type=int, default=50_000)
+        parser.add_argument('--payments', type=int, default=100_000)
+        parser.add_argument('--large-table-rows', type=int, default=1_000,
+                            help='Таблицы с большим количеством строк считаются большими')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            self.seed(options)
+            with connection.cursor() as cursor:
+                for model in (User, Course, Lesson, Subscription, Payment):
+                    cursor.execute(f'ANALYZE {model._meta.db_table}')
+            large_tables = self.get_large_tables(options['large_table_rows'])
+            failures = []
+            for name, run in self.get_queries():
+                queries = self.capture(run)
+                plans = [self.explain(sql) for sql in queries]
+                full_counts = {match[1] for sql in queries if (match := FULL_COUNT_RE.match(sql))}
+                scanned = {
+                    table for sql, plan in zip(queries, plans) if not FULL_COUNT_RE.match(sql)
+                    for table in SEQ_SCAN_RE.findall(plan)
+                } & large_tables
+                status = 'SEQ SCAN: ' + ', '.join(sorted(scanned)) if scanned else 'ok'
+                if full_counts & large_tables:
+                    status += '; COUNT(*) по всей таблице: ' + ', '.join(sorted(full_counts & large_tables))
+                self.stdout.write(f'{name}: {status}')
+                if options['verbosity'] > 1 or scanned:
+                    self.stdout.write('\n\n'.join(plans))
+                if scanned:
+                    failures.append(name)
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Seq Scan по большой таблице: {", ".join(failures)}')
+
+    def seed(self, options):
+        password = make_password(None)
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(email=f'plan-{i}@example.com', password=password,
+                 last_login=now - timedelta(days=self.random.randint(0, 90)) if self.random.random() < 0.9 else None,
+                 date_joined=now - timedelta(days=self.random.randint(0, 365)))
+            for i in range(options['users'])
+        )
+        courses = Course.objects.bulk_create(
+            Course(title=f'course {i}', owner=self.random.choice(users)) for i in range(options['courses'])
+        )
+        lessons = Lesson.objects.bulk_create(
+            Lesson(title=f'lesson {i}', course=course, owner=course.owner)
+            for course in courses for i in range(options['lessons_per_course'])
+        )
+        pairs = {
+            (self.random.choice(users).id, self.random.choice(courses).id)
+            for _ in range(options['subscriptions'])
+        }
+        Subscription.objects.bulk_create(Subscription(user_id=user_id, course_id=course_id)
+                                         for user_id, course_id in pairs)
+        payments = []
+        for _ in range(options['payments']):
+            lesson = self.random.choice(lessons) if self.random.random() < 0.5 else None
+            payments.append(Payment(
+                user=self.random.choice(users),
+                course=None if lesson else self.random.choice(courses),
+                lesson=lesson,
+                amount=Decimal(self.random.randint(1, 500_000)) / 100,
+                payment_method=self.random.choice(['cash', 'transfer']),
+                stripe_session_id=f'cs_plan_{len(payments)}',
+            ))
+        Payment.objects.bulk_create(payments, batch_size=10_000)
+        self.user = users[0]
+        self.course = courses[0]
+        self.lesson = lessons[0]
+
+    def get_large_tables(self, min_rows):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relname FROM pg_class WHERE relkind = %s AND reltuples >= %s',
+                ['r', min_rows],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def capture(self, run):
+        """
+        Выполняет run и возвращает SQL выполненных им запросов.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        return [query['sql'] for query in queries.captured_queries]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def get_view(self, view_class, user, actions=None, query=None, **kwargs):
+        """
+        Создает представление для GET-запроса пользователя user так же,
+        как as_view(), но без обработки запроса.
+        """
+        request = RequestFactory().get('/', query or {})
+        force_authenticate(request, user=user)
+        view = view_class(**({'action_map': actions} if actions else {}))
+        view.args, view.kwargs = (), kwargs
+        view.request = view.initialize_request(request)
+        view.format_kwarg = None
+        return view
+
+    def list_view(self, view_class, user, query=None, actions=None):
+        """
+        Возвращает функцию, выбирающую страницу списка как ListModelMixin.list:
+        фильтры, пагинация (с COUNT(*) постраничного режима) и подгрузка.
+        """
+        def run():
+            view = self.get_view(view_class, user, actions, query)
+            queryset = view.filter_queryset(view.get_queryset())
+            if view.paginate_queryset(queryset) is None:
+                list(queryset)
+        return run
+
+    def retrieve_view(self, view_class, user, pk, actions=None):
+        """
+        Возвращает функцию, выбирающую объект как RetrieveModelMixin.retrieve,
+        и проверку доступа перед отдачей закэшированного ответа.
+        """
+        def run():
+            view = self.get_view(view_class, user, actions, pk=pk)
+            view.get_object()
+            view.check_cached_object_permissions()
+        return run
+
+    def get_queries(self):
+        user, course, lesson = self.user, self.course, self.lesson
+        owner = course.owner
+        stale_login = timezone.now() - timedelta(days=89)
+        # Без фильтра по курсу, уроку или сумме список платежей не разбит на
+        # страницы и читает большую часть таблицы, поэтому не проверяется
+        return [
+            ('CourseViewSet.list', self.list_view(CourseViewSet, owner, actions={'get': 'list'})),
+            ('CourseViewSet.list ?pagination=cursor',
+             self.list_view(CourseViewSet, owner, {'pagination': 'cursor'}, actions={'get': 'list'})),
+            ('CourseViewSet.retrieve',
+             self.retrieve_view(CourseViewSet, owner, course.pk, actions={'get': 'retrieve'})),
+            ('LessonListAPIView', self.list_view(LessonListAPIView, owner)),
+            ('LessonListAPIView ?pagination=cursor',
+             self.list_view(LessonListAPIView, owner, {'pagination': 'cursor'})),
+            ('LessonRetrieveAPIView', self.retrieve_view(LessonRetrieveAPIView, lesson.owner, lesson.pk)),
+            ('SubscriptionCreateAPIView', lambda: Subscription.objects.toggle(user.id, course.id)),
+            ('send_course_update_email', lambda: list(Subscription.objects.filter(
+                course_id=course.id, user__isnull=False,
+            ).values_list('user__email', flat=True).distinct())),
+            ('check_inactive_users', lambda: list(get_inactive_users(
+                stale_login, user.id, user.id + settings.INACTIVE_USERS_CHUNK_SIZE
+            ).order_by())),
+            ('PaymentListAPIView ?course=', self.list_view(PaymentListAPIView, owner, {'course': course.id})),
+            ('PaymentListAPIView ?lesson=', self.list_view(PaymentListAPIView, owner, {'lesson': lesson.id})),
+            ('PaymentListAPIView ?amount=', self.list_view(PaymentListAPIView, owner, {'amount': '10.00'})),
+            ('UserViewSet.list ?expand=payments',
+             self.list_view(UserViewSet, user, {'expand': 'payments'}, actions={'get': 'list'})),
+            ('process_stripe_events', lambda: list(Payment.objects.filter(
+                stripe_session_id__in=['cs_plan_1', 'cs_plan_2'],
+            ))),
+        ]
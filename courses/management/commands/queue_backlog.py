@@ -0,0 +1,105 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management import BaseCommand
+from kombu.transport import virtual
+
+from config.celery import app, use_broker_url
+
+
+class Command(BaseCommand):
+    help = ('Выводит количество ожидающих сообщений в очередях Celery и, с --workers, '
+            'воркеров, получающих задачи из каждой очереди, и задачи, уже полученные воркерами: '
+            'выполняющиеся, предвыбранные и отложенные по ETA.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', help='Очереди; по умолчанию - все очереди из настроек')
+        parser.add_argument('--broker', help='Адрес брокера; по умолчанию - из настроек')
+        parser.add_argument('--workers', action='store_true', help='Опросить воркеров')
+        parser.add_argument('--timeout', type=float, default=1.0, help='Время ожидания ответа воркеров, секунды')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в формате JSON')
+
+    def handle(self, *args, **options):
+        # Команды воркерам публикуются через пул продюсеров приложения,
+        # поэтому адрес брокера задается для всей команды
+        with use_broker_url(options['broker']) if options['broker'] else nullcontext():
+            result = self.collect(options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(f'{"queue":<30} {"messages":>10}' + (f' {"consumers":>10}' if options['workers'] else ''))
+        for name, stats in result['queues'].items():
+            line = f'{name:<30} {"missing" if stats is None else stats["messages"]:>10}'
+            if options['workers']:
+                line += f' {"-" if stats is None else len(stats["consumers"]):>10}'
+            self.stdout.write(line)
+        if options['workers']:
+            self.stdout.write('')
+            self.stdout.write(f'{"worker":<30} {"active":>10} {"reserved":>10} {"scheduled":>10}')
+            for name, stats in result['workers'].items():
+                self.stdout.write(f'{name:<30} {stats["active"]:>10} {stats["reserved"]:>10} '
+                                  f'{stats["scheduled"]:>10}')
+
+    def collect(self, options):
+        queues = options['queues'] or sorted(app.amqp.queues)
+        result = {'queues': self.get_queue_sizes(queues)}
+        if options['workers']:
+            inspect = app.control.inspect(timeout=options['timeout'])
+            consumers = self.get_queue_consumers(inspect)
+            result['workers'] = self.get_worker_tasks(inspect)
+            for name, stats in result['queues'].items():
+                if stats is not None:
+                    stats['consumers'] = consumers.get(name, [])
+        return result
+
+    def get_queue_sizes(self, queues):
+        """
+        Возвращает для каждой очереди количество сообщений в брокере
+        или None, если очередь не существует.
+
+        В Redis очередь - это список, который удаляется, когда становится
+        пустым, поэтому размер читается напрямую (с учетом списков приоритетов),
+        а очереди из настроек без сообщений считаются пустыми. В AMQP
+        очередь проверяется пассивным объявлением.
+        """
+        sizes = {}
+        with app.connection_for_read() as conn:
+            for name in queues:
+                messages = self.get_queue_size(conn, name)
+                sizes[name] = None if messages is None else {'messages': messages}
+        return sizes
+
+    def get_queue_size(self, conn, name):
+        with conn.channel() as channel:
+            if isinstance(channel, virtual.Channel):
+                messages = channel._size(name)
+                return messages if messages or name in app.amqp.queues else None
+        # Пассивное объявление не создает очередь; ошибка закрывает канал,
+        # поэтому каждая очередь проверяется в своем канале
+        try:
+            with conn.channel() as channel:
+                return channel.queue_declare(name, passive=True).message_count
+        except conn.channel_errors:
+            return None
+
+    def get_queue_consumers(self, inspect):
+        """
+        Возвращает для каждой очереди имена воркеров, получающих из нее задачи.
+        """
+        consumers = {}
+        for worker, queues in sorted((inspect.active_queues() or {}).items()):
+            for queue in queues:
+                consumers.setdefault(queue['name'], []).append(worker)
+        return consumers
+
+    def get_worker_tasks(self, inspect):
+        replies = {
+            state: getattr(inspect, state)() or {}
+            for state in ('active', 'reserved', 'scheduled')
+        }
+        workers = sorted(set().union(*replies.values()))
+        return {
+            worker: {state: len(reply.get(worker, [])) for state, reply in replies.items()}
+            for worker in workers
+        }
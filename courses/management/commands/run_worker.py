@@ -0,0 +1,50 @@
+import argparse
+import os
+import shlex
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+
+def get_worker_argv(name, profile):
+    """
+    Возвращает командную строку воркера Celery для профиля из WORKER_PROFILES.
+    Пул передается аргументом -P, потому что celery выполняет monkey patching
+    для eventlet до загрузки приложения только по аргументам командной строки.
+    """
+    argv = [
+        sys.executable, '-m', 'celery', '-A', 'config', 'worker',
+        '-n', f'{name}@%h',
+        '-Q', ','.join(profile['queues']),
+        '-P', profile['pool'],
+        '-c', str(profile['concurrency']),
+        '--prefetch-multiplier', str(profile['prefetch_multiplier']),
+    ]
+    if profile.get('max_tasks_per_child'):
+        argv += ['--max-tasks-per-child', str(profile['max_tasks_per_child'])]
+    return argv
+
+
+class Command(BaseCommand):
+    help = ('Запускает воркер Celery с очередями, пулом, количеством одновременных задач '
+            'и предвыборкой из профиля WORKER_PROFILES. Аргументы после имени профиля '
+            'передаются celery worker и переопределяют значения профиля, поэтому '
+            'параметры команды указываются до него.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile', help='Имя профиля из WORKER_PROFILES')
+        parser.add_argument('--dry-run', action='store_true', help='Только вывести команду запуска')
+        parser.add_argument('celery_args', nargs=argparse.REMAINDER, help='Аргументы celery worker')
+
+    def handle(self, *args, **options):
+        profile = settings.WORKER_PROFILES.get(options['profile'])
+        if profile is None:
+            raise CommandError(f'Unknown worker profile {options["profile"]!r}, '
+                               f'expected one of: {", ".join(settings.WORKER_PROFILES)}')
+        argv = get_worker_argv(options['profile'], profile) + options['celery_args']
+        if options['dry_run']:
+            self.stdout.write(shlex.join(argv))
+            return
+        sys.stdout.flush()
+        os.execv(argv[0], argv)
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_subscriptions(apps, schema_editor):
+    Subscription = apps.get_model('courses', 'Subscription')
+    keep_ids = Subscription.objects.values('user', 'course').annotate(keep_id=Min('id')).values('keep_id')
+    Subscription.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_delete_stripepayment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'course'), name='unique_subscription_user_course'),
+        ),
+    ]
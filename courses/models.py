@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, connection
 from django.conf import settings
 
 
@@ -6,7 +6,9 @@ class Course(models.Model):
     title = models.CharField(max_length=200, verbose_name='название курса')
     preview = models.ImageField(upload_to='course_previews/', verbose_name='превью', blank=True, null=True)
     description = models.TextField(verbose_name='описание', blank=True, null=True)
-    owner = models.ForeignKey('users.User', on_delete=models.CASCADE, verbose_name='Владелец', blank=True, null=True)
+    # Поиск по владельцу обслуживает составной индекс course_owner_id_idx
+    owner = models.ForeignKey('users.User', on_delete=models.CASCADE, verbose_name='Владелец', blank=True, null=True,
+                              db_index=False)
 
     def __str__(self):
         return self.title
@@ -14,10 +16,15 @@ class Course(models.Model):
     class Meta:
         verbose_name = 'Курс'
         verbose_name_plural = 'Курсы'
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='course_owner_id_idx'),
+        ]
 
 
 class Lesson(models.Model):
-    course = models.ForeignKey(Course, related_name='lessons', verbose_name='курс', on_delete=models.CASCADE)
+    # Поиск по курсу обслуживает составной индекс lesson_course_id_idx
+    course = models.ForeignKey(Course, related_name='lessons', verbose_name='курс', on_delete=models.CASCADE,
+                               db_index=False)
     title = models.CharField(max_length=200, verbose_name='название урока')
     description = models.TextField(verbose_name='описание', blank=True, null=True)
     preview = models.ImageField(upload_to='lesson_previews/', verbose_name='превью', blank=True, null=True)
@@ -30,15 +37,107 @@ class Lesson(models.Model):
     class Meta:
         verbose_name = 'Урок'
         verbose_name_plural = 'Уроки'
+        indexes = [
+            models.Index(fields=['course', 'id'], name='lesson_course_id_idx'),
+        ]
+
+
+def course_id_in_range(course_id):
+    """
+    Проверяет, что id помещается в тип первичного ключа курса: иначе
+    база данных отклонила бы запрос с DataError.
+    """
+    min_value, max_value = connection.ops.integer_field_range(Course._meta.pk.get_internal_type())
+    return min_value <= course_id <= max_value
+
+
+class SubscriptionManager(models.Manager):
+
+    def toggle(self, user_id, course_id):
+        """
+        Подписывает пользователя на курс или отменяет подписку одним запросом.
+
+        Возвращает True, если подписка добавлена, False, если удалена,
+        и None, если курса не существует.
+        """
+        if not course_id_in_range(course_id):
+            return None
+        subscription_table = self.model._meta.db_table
+        course_table = Course._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH deleted AS (
+                    DELETE FROM {subscription_table} WHERE user_id = %s AND course_id = %s RETURNING id
+                ), inserted AS (
+                    INSERT INTO {subscription_table} (user_id, course_id)
+                    SELECT %s, id FROM {course_table}
+                    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM deleted)
+                    ON CONFLICT (user_id, course_id) DO NOTHING
+                    RETURNING id
+                )
+                SELECT (SELECT count(*) FROM deleted),
+                       EXISTS (SELECT 1 FROM {course_table} WHERE id = %s)
+                """,
+                [user_id, course_id, user_id, course_id, course_id],
+            )
+            deleted, course_exists = cursor.fetchone()
+        if deleted:
+            return False
+        return True if course_exists else None
+
+    def subscribe_many(self, user_id, course_ids):
+        """
+        Подписывает пользователя на существующие курсы из списка одним запросом.
+        Возвращает id курсов, подписка на которые была добавлена.
+        """
+        subscription_table = self.model._meta.db_table
+        course_table = Course._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {subscription_table} (user_id, course_id)
+                SELECT %s, id FROM {course_table} WHERE id = ANY(%s)
+                ON CONFLICT (user_id, course_id) DO NOTHING
+                RETURNING course_id
+                """,
+                [user_id, list(course_ids)],
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def unsubscribe_many(self, user_id, course_ids):
+        """
+        Отменяет подписки пользователя на курсы из списка одним запросом.
+        Возвращает id курсов, подписка на которые была удалена.
+        """
+        subscription_table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {subscription_table} WHERE user_id = %s AND course_id = ANY(%s) RETURNING course_id",
+                [user_id, list(course_ids)],
+            )
+            return sorted(row[0] for row in cursor.fetchall())
 
 
 class Subscription(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='пользователь', blank=True, null=True)
-    course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, verbose_name='курс', blank=True, null=True)
+    # Поиск по пользователю и по курсу обслуживают индексы unique_subscription_user_course
+    # и subscription_course_user_idx
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='пользователь', blank=True, null=True,
+                             db_index=False)
+    course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, verbose_name='курс', blank=True, null=True,
+                               db_index=False)
+
+    objects = SubscriptionManager()
 
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='unique_subscription_user_course'),
+        ]
+        indexes = [
+            models.Index(fields=['course', 'user'], name='subscription_course_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.course}'
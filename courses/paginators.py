@@ -1,7 +1,43 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+
+
+class CourseLessonCursorPaginator(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по первичному ключу.
+
+    Не выполняет COUNT(*) и OFFSET, поэтому стоимость страницы
+    не зависит от ее номера.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
 
 
 class CourseLessonPaginator(PageNumberPagination):
+    """
+    Постраничная пагинация с возможностью перейти на курсорную
+    через параметр запроса ?pagination=cursor или ?cursor=.
+    """
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    mode_query_param = 'pagination'
+    cursor_paginator_class = CourseLessonCursorPaginator
+
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_paginator_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,29 +1,88 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Course, Lesson, Subscription
+from rest_framework.permissions import SAFE_METHODS
+from .models import Course, Lesson, Subscription, course_id_in_range
 from .validators import YouTubeLinkValidator
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле первичного ключа, которое ищет объект среди заранее загруженных
+    в context['prefetched'][<модель>] вместо отдельного запроса к базе.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.get_queryset().model)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if isinstance(data, bool) or pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+
 class LessonSerializer(serializers.ModelSerializer):
-    video_url = serializers.URLField(validators=[YouTubeLinkValidator])
+    video_url = serializers.URLField(validators=[YouTubeLinkValidator()])
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
 
     class Meta:
         model = Lesson
         fields = '__all__'
 
 
+def get_query_param_list(request, name):
+    """
+    Возвращает множество значений параметра запроса вида ?name=a,b,c
+    или None, если параметр не передан.
+    """
+    if request is None or name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+
 class CourseSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор курса.
+
+    Поддерживает параметры запроса:
+        ?fields=title,preview - вернуть только перечисленные поля (для чтения);
+        ?expand=lessons - встроить список уроков курса.
+    """
     lessons_amount = serializers.SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
+    expandable_fields = ('lessons',)
+
     class Meta:
         model = Course
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = get_query_param_list(request, 'fields')
+        expand = (get_query_param_list(request, 'expand') or set()) | (requested or set())
+        for field_name in self.expandable_fields:
+            if field_name not in expand:
+                self.fields.pop(field_name)
+        if requested is not None and request.method in SAFE_METHODS:
+            for field_name in set(self.fields) - requested - expand:
+                self.fields.pop(field_name)
+
     def get_lessons_amount(self, instance):
+        # Значение берется из аннотации CourseViewSet.get_queryset,
+        # запрос к базе выполняется только для неаннотированных объектов.
+        if hasattr(instance, 'lessons_count'):
+            return instance.lessons_count
         return instance.lessons.count()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return Subscription.objects.filter(user=user, course=obj).exists()
 
@@ -34,3 +93,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscription
         fields = ['id', 'user', 'course']
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    course_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    action = serializers.ChoiceField(choices=['subscribe', 'unsubscribe'])
+
+    def validate_course_ids(self, value):
+        max_items = settings.SUBSCRIPTION_BULK_MAX_ITEMS
+        if len(value) > max_items:
+            raise serializers.ValidationError(f'Не более {max_items} курсов в одном запросе.')
+        if not all(course_id_in_range(course_id) for course_id in value):
+            raise serializers.ValidationError('Некорректный id курса.')
+        return value
@@ -1,7 +1,13 @@
 import json
 from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django_celery_beat.models import IntervalSchedule, PeriodicTask
 
+from courses.tasks import send_course_update_email
+from users.tasks import sync_stripe_catalog
+
 
 def set_schedule(*args, **kwargs):
     schedule, created = IntervalSchedule.objects.get_or_create(
@@ -17,3 +23,33 @@ def set_schedule(*args, **kwargs):
         }),
         expires=datetime.utcnow() + timedelta(seconds=30)
     )
+
+
+def schedule_course_update_email(course_id):
+    """
+    Планирует уведомление подписчиков об обновлении курса.
+
+    Все обновления курса в течение COURSE_UPDATE_EMAIL_WINDOW объединяются
+    в одну задачу: первое обновление ставит задачу с отложенным запуском
+    и ключ в кэше, последующие видят ключ и ничего не ставят. Задача читает
+    курс в момент запуска, поэтому письмо отражает последнюю правку.
+    Ключ виден всем процессам только при общем кэше (CACHE_REDIS_URL).
+    """
+    window = int(settings.COURSE_UPDATE_EMAIL_WINDOW.total_seconds())
+    if window <= 0:
+        send_course_update_email.delay(course_id)
+        return True
+    if not cache.add(f'course-update-email:{course_id}', True, timeout=window):
+        return False
+    send_course_update_email.apply_async((course_id,), countdown=window)
+    return True
+
+
+def schedule_stripe_catalog_sync(course_ids=(), lesson_ids=()):
+    """
+    Ставит после фиксации транзакции задачу синхронизации продуктов Stripe
+    для новых или переименованных курсов и уроков.
+    """
+    course_ids, lesson_ids = list(course_ids), list(lesson_ids)
+    if course_ids or lesson_ids:
+        transaction.on_commit(lambda: sync_stripe_catalog.delay(course_ids=course_ids, lesson_ids=lesson_ids))
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from courses.cache import invalidate_course, invalidate_lesson, invalidate_subscriptions
+from courses.models import Course, Lesson, Subscription
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_responses(sender, instance, **kwargs):
+    invalidate_course(instance.id)
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_previous_course(sender, instance, **kwargs):
+    """
+    Запоминает курс изменяемого урока, чтобы при переносе урока в другой
+    курс сбросить ответы и прежнего курса.
+    """
+    instance._previous_course_id = None
+    if instance._state.adding or instance.pk is None:
+        return
+    instance._previous_course_id = Lesson.objects.filter(pk=instance.pk).values_list('course_id', flat=True).first()
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_responses(sender, instance, **kwargs):
+    invalidate_lesson(instance.id, instance.course_id)
+    previous_course_id = getattr(instance, '_previous_course_id', None)
+    if previous_course_id is not None and previous_course_id != instance.course_id:
+        invalidate_course(previous_course_id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_responses(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении курса его ответы уже сброшены по версиям курса,
+    # сбрасывать версию каждого подписчика не нужно
+    if isinstance(origin, Course) or instance.user_id is None:
+        return
+    invalidate_subscriptions(instance.user_id)
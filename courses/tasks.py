@@ -1,33 +1,118 @@
+import logging
+import time
 from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q
+from users.authentication import set_users_active_state
 from users.models import User
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.utils import timezone
 from courses.models import Course, Subscription
 
+COURSE_UPDATE_SUBJECT = 'Уведомление об обновлении курса'
+COURSE_UPDATE_FROM_EMAIL = 'manu_alex_ilov@mail.ru'
+INACTIVE_USERS_PROGRESS_KEY = 'check_inactive_users:next_id'
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def send_course_update_email(course_id):
-    try:
-        course = Course.objects.get(id=course_id)
-        subscriptions = Subscription.objects.filter(course=course)
-        subscriber_emails = [subscription.user.email for subscription in subscriptions]
-        if subscriber_emails:
-            send_mail(
-                'Уведомление об обновлении курса',
-                f'Курс "{course.title}" был обновлен.',
-                'manu_alex_ilov@mail.ru',
-                subscriber_emails,
-                fail_silently=False,
-            )
-    except Course.DoesNotExist:
-        pass
+    """
+    Рассылает подписчикам курса уведомление об обновлении.
+
+    Адреса читаются потоком с сервера и делятся на пачки размером
+    COURSE_UPDATE_EMAIL_CHUNK_SIZE, каждая пачка отправляется отдельной задачей.
+    """
+    title = Course.objects.filter(id=course_id).values_list('title', flat=True).first()
+    if title is None:
+        return
+    chunk_size = settings.COURSE_UPDATE_EMAIL_CHUNK_SIZE
+    subscriber_emails = Subscription.objects.filter(
+        course_id=course_id, user__isnull=False
+    ).values_list('user__email', flat=True).distinct().iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for email in subscriber_emails:
+        chunk.append(email)
+        if len(chunk) == chunk_size:
+            send_course_update_email_chunk.delay(title, chunk)
+            chunk = []
+    if chunk:
+        send_course_update_email_chunk.delay(title, chunk)
 
 
 @shared_task
-def check_inactive_users():
+def send_course_update_email_chunk(title, emails):
+    """
+    Отправляет каждому адресату отдельное письмо через одно SMTP-соединение.
+    """
+    messages = [
+        EmailMessage(COURSE_UPDATE_SUBJECT, f'Курс "{title}" был обновлен.', COURSE_UPDATE_FROM_EMAIL, [email])
+        for email in emails
+    ]
+    with get_connection(fail_silently=False) as connection:
+        return connection.send_messages(messages)
+
+
+def get_inactive_users(stale_before, lower, upper):
+    """
+    Возвращает активных пользователей с id в [lower, upper), не заходивших
+    с stale_before или, если не заходили ни разу, зарегистрированных раньше.
+    """
+    stale = Q(last_login__lt=stale_before) | Q(last_login__isnull=True, date_joined__lt=stale_before)
+    return User.objects.filter(stale, is_active=True, id__gte=lower, id__lt=upper)
+
+
+def deactivate_users(queryset):
+    """
+    Деактивирует пользователей queryset и возвращает их id, нужные для кэша
+    активности. Строки выбираются с блокировкой SELECT ... FOR UPDATE,
+    поэтому UPDATE по первичному ключу изменяет ровно выбранных пользователей.
+    """
+    with transaction.atomic():
+        user_ids = list(queryset.select_for_update().values_list('id', flat=True))
+        if user_ids:
+            User.objects.filter(pk__in=user_ids).update(is_active=False)
+    return user_ids
+
+
+@shared_task
+def check_inactive_users(start_id=None, chunk_size=None):
+    """
+    Деактивирует пользователей, не заходивших больше месяца, а также
+    никогда не заходивших, если с регистрации прошло больше месяца.
+
+    Обновление выполняется пачками по диапазонам первичного ключа
+    размером INACTIVE_USERS_CHUNK_SIZE, каждая пачка - одним UPDATE
+    по id, выбранным с блокировкой.
+    Последний обработанный id сохраняется в кэше, поэтому прерванный
+    запуск продолжается с того же места.
+    """
+    started = time.monotonic()
+    chunk_size = chunk_size or settings.INACTIVE_USERS_CHUNK_SIZE
     one_month_ago = timezone.now() - timedelta(days=30)
-    inactive_users = User.objects.filter(last_login__lt=one_month_ago, is_active=True)
-    for user in inactive_users:
-        user.is_active = False
-        user.save()
+
+    if start_id is None:
+        start_id = cache.get(INACTIVE_USERS_PROGRESS_KEY, 0)
+    max_id = User.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    chunks = []
+    for lower in range(start_id, max_id + 1, chunk_size):
+        upper = lower + chunk_size
+        user_ids = deactivate_users(get_inactive_users(one_month_ago, lower, upper))
+        set_users_active_state(user_ids, False)
+        cache.set(INACTIVE_USERS_PROGRESS_KEY, upper, timeout=None)
+        chunks.append(len(user_ids))
+    cache.delete(INACTIVE_USERS_PROGRESS_KEY)
+
+    result = {
+        'updated': sum(chunks),
+        'chunks': chunks,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    logger.info('check_inactive_users: %(updated)s users deactivated in %(seconds)ss', result)
+    return result
@@ -1,8 +1,32 @@
+import io
+import json
+import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
 from rest_framework import status
+from django.core import mail
+from django.core.cache import cache
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from config.celery import app as celery_app
+from config.metrics import registry
+from courses.benchmarks import compare, summarize
+from courses.cache import local_cache
 from courses.models import Course, Lesson, Subscription
+from config.task_metrics import PUBLISHED_AT_HEADER, serve_metrics
+from courses.tasks import check_inactive_users, send_course_update_email, send_course_update_email_chunk
+from users.serializers import UserTokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -42,6 +66,14 @@ class LessonTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['title'], 'Updated Lesson')
 
+    def test_update_lesson_resolves_roles_once(self):
+        """Роли пользователя запрашиваются один раз, владелец урока не загружается"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/lesson/update/{self.lesson.id}/', data={'title': 'Updated Lesson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum('auth_group' in query['sql'] for query in queries), 1)
+        self.assertFalse(any('"users_user"' in query['sql'] for query in queries))
+
     def test_delete_lesson(self):
         """Тестирование удаления урока"""
         response = self.client.delete(f'/lesson/delete/{self.lesson.id}/')
@@ -49,6 +81,44 @@ class LessonTestCase(APITestCase):
         self.assertFalse(Lesson.objects.filter(id=self.lesson.id).exists())
 
 
+class LessonBulkCreateTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.courses = [Course.objects.create(title=f'course {i}', owner=self.user) for i in range(3)]
+
+    def lessons_payload(self, amount):
+        return [
+            {'title': f'lesson {i}', 'course': self.courses[i % 3].id, 'video_url': f'https://www.youtube.com/{i}'}
+            for i in range(amount)
+        ]
+
+    def test_bulk_create_constant_queries(self):
+        """Количество запросов при массовом создании уроков не зависит от их числа"""
+        with self.assertNumQueries(5):
+            response = self.client.post('/lesson/bulk-create/', self.lessons_payload(5), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(5):
+            response = self.client.post('/lesson/bulk-create/', self.lessons_payload(300), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 300)
+        self.assertEqual(Lesson.objects.filter(owner=self.user).count(), 305)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        """Ошибки возвращаются по индексам элементов, уроки не создаются"""
+        payload = self.lessons_payload(3)
+        payload[1]['video_url'] = 'https://vimeo.com/1'
+        payload[2]['course'] = 0
+        response = self.client.post('/lesson/bulk-create/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('video_url', errors[1])
+        self.assertIn('course', errors[2])
+        self.assertFalse(Lesson.objects.exists())
+
+
 class SubscriptionTestCase(APITestCase):
     def setUp(self) -> None:
         self.client = APIClient()
@@ -73,3 +143,503 @@ class SubscriptionTestCase(APITestCase):
             response.json(),
             {'message': 'Подписка удалена'}
         )
+
+    def test_toggle_subscription_single_query(self):
+        """Повторное переключение добавляет подписку одним запросом"""
+        self.client.post(reverse('courses:subscription-create'), data={'course_id': self.course.id})
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('courses:subscription-create'), data={'course_id': self.course.id})
+        self.assertEqual(response.json(), {'message': 'Подписка добавлена'})
+        self.assertEqual(Subscription.objects.filter(user=self.user, course=self.course).count(), 1)
+
+    def test_toggle_missing_course(self):
+        """Подписка на несуществующий курс возвращает 404"""
+        response = self.client.post(reverse('courses:subscription-create'), data={'course_id': 0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_toggle_out_of_range_course_id(self):
+        """id курса вне диапазона bigint возвращает 404, а не ошибку базы данных"""
+        response = self.client.post(reverse('courses:subscription-create'), data={'course_id': 2 ** 63})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('courses:subscription-bulk'),
+                                    {'course_ids': [self.course.id, 2 ** 63], 'action': 'subscribe'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SUBSCRIPTION_BULK_MAX_ITEMS=2)
+    def test_bulk_subscription_max_items(self):
+        """Количество курсов в массовой подписке ограничено SUBSCRIPTION_BULK_MAX_ITEMS"""
+        response = self.client.post(reverse('courses:subscription-bulk'),
+                                    {'course_ids': [1, 2, 3], 'action': 'subscribe'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_duplicate_subscription_is_rejected(self):
+        """Повторная подписка на тот же курс запрещена ограничением уникальности"""
+        with self.assertRaises(IntegrityError):
+            Subscription.objects.create(course=self.course, user=self.user)
+
+    def test_bulk_subscription(self):
+        """Массовая подписка и отписка изменяют только существующие курсы"""
+        other = Course.objects.create(title='other', owner=self.user)
+        url = reverse('courses:subscription-bulk')
+        response = self.client.post(url, {'course_ids': [self.course.id, other.id, 0], 'action': 'subscribe'},
+                                    format='json')
+        self.assertEqual(response.json(), {'subscribed': [other.id]})
+        response = self.client.post(url, {'course_ids': [self.course.id, other.id], 'action': 'unsubscribe'},
+                                    format='json')
+        self.assertEqual(response.json(), {'unsubscribed': sorted([self.course.id, other.id])})
+        self.assertFalse(Subscription.objects.filter(user=self.user).exists())
+
+
+class CourseListQueriesTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+
+    def create_courses(self, amount):
+        for i in range(amount):
+            course = Course.objects.create(title=f'course {i}', owner=self.user)
+            Lesson.objects.create(title=f'lesson {i}', course=course,
+                                  video_url='https://www.youtube.com/123', owner=self.user)
+            Subscription.objects.create(course=course, user=self.user)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        """Количество запросов при получении списка курсов не зависит от размера страницы"""
+        self.create_courses(2)
+        with self.assertNumQueries(4):
+            response = self.client.get('/courses/', {'page_size': 2, 'expand': 'lessons'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.create_courses(50)
+        with self.assertNumQueries(4):
+            response = self.client.get('/courses/', {'page_size': 50, 'expand': 'lessons'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(response.data['results'][0]['lessons_amount'], 1)
+        self.assertTrue(response.data['results'][0]['is_subscribed'])
+        self.assertEqual(len(response.data['results'][0]['lessons']), 1)
+
+    def test_sparse_fields(self):
+        """Параметр fields ограничивает поля ответа и выбираемые столбцы"""
+        self.create_courses(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/courses/', {'fields': 'title,preview'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'title', 'preview'})
+        self.assertFalse(any('"courses_lesson"' in query['sql'] for query in queries))
+        self.assertFalse(any('"description"' in query['sql'] for query in queries))
+
+    def test_lessons_are_opt_in(self):
+        """Уроки встраиваются в ответ только при ?expand=lessons"""
+        self.create_courses(1)
+        response = self.client.get('/courses/')
+        self.assertNotIn('lessons', response.data['results'][0])
+        self.assertIn('lessons_amount', response.data['results'][0])
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+        for i in range(5):
+            Lesson.objects.create(title=f'lesson {i}', course=self.course,
+                                  video_url='https://www.youtube.com/123', owner=self.user)
+
+    def test_cursor_pagination_skips_count(self):
+        """Курсорная пагинация уроков обходит все страницы без COUNT(*)"""
+        titles = []
+        url, params = '/lesson/', {'pagination': 'cursor', 'page_size': 2}
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+            self.assertNotIn('count', response.data)
+            titles += [lesson['title'] for lesson in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(titles, [f'lesson {i}' for i in range(5)])
+
+    def test_page_number_pagination_by_default(self):
+        """Без параметра используется постраничная пагинация"""
+        response = self.client.get('/lesson/')
+        self.assertEqual(response.data['count'], 5)
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+        self.lesson = Lesson.objects.create(title='test lesson', course=self.course,
+                                            video_url='https://www.youtube.com/123', owner=self.user)
+
+    def test_cached_course_retrieve_and_etag(self):
+        """Повторное чтение курса берется из кэша, при совпадении ETag возвращается 304"""
+        url = f'/courses/{self.course.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response['ETag'], etag)
+        course_queries = [query['sql'] for query in queries if 'courses_' in query['sql']]
+        self.assertEqual(len(course_queries), 1)
+        self.assertNotIn('courses_lesson', course_queries[0])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_lesson_update_invalidates_cache(self):
+        """Изменение урока сбрасывает закэшированные ответы урока и курса"""
+        lesson_url = f'/lesson/{self.lesson.id}/'
+        course_url = f'/courses/{self.course.id}/'
+        self.client.get(lesson_url)
+        etag = self.client.get(course_url, {'expand': 'lessons'})['ETag']
+
+        self.client.patch(f'/lesson/update/{self.lesson.id}/', data={'title': 'Updated Lesson'})
+
+        self.assertEqual(self.client.get(lesson_url).json()['title'], 'Updated Lesson')
+        response = self.client.get(course_url, {'expand': 'lessons'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['lessons'][0]['title'], 'Updated Lesson')
+
+    def test_course_delete_invalidates_lessons(self):
+        """Каскадное удаление уроков вместе с курсом сбрасывает их закэшированные ответы"""
+        self.client.get(f'/lesson/{self.lesson.id}/')
+        self.assertEqual(len(self.client.get('/lesson/').json()['results']), 1)
+        self.course.delete()
+        self.assertEqual(self.client.get(f'/lesson/{self.lesson.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/lesson/').json()['results'], [])
+
+    def test_orm_update_invalidates_cache(self):
+        """Изменение курса в обход API (админка, ORM) сбрасывает закэшированные ответы"""
+        url = f'/courses/{self.course.id}/'
+        self.client.get(url)
+        self.course.title = 'Renamed'
+        self.course.save()
+        self.assertEqual(self.client.get(url).json()['title'], 'Renamed')
+
+    def test_cached_retrieve_checks_permissions(self):
+        """Закэшированный урок не отдается пользователю, потерявшему доступ"""
+        url = f'/lesson/{self.lesson.id}/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        other = User.objects.create(email='other@test.ru', password='123')
+        Lesson.objects.filter(pk=self.lesson.pk).update(owner=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_role_change_changes_cache_key(self):
+        """После добавления в группу модераторов пользователь не получает ответ, закэшированный до этого"""
+        other = User.objects.create(email='other@test.ru', password='123')
+        Course.objects.create(title='other course', owner=other)
+        self.assertEqual(len(self.client.get('/courses/').json()['results']), 1)
+        self.user.groups.add(Group.objects.create(name='Модераторы'))
+        self.assertEqual(len(self.client.get('/courses/').json()['results']), 2)
+
+    def test_subscription_toggle_invalidates_cache(self):
+        """Подписка на курс сбрасывает закэшированный признак is_subscribed"""
+        url = f'/courses/{self.course.id}/'
+        self.assertFalse(self.client.get(url).json()['is_subscribed'])
+        self.client.post(reverse('courses:subscription-create'), data={'course_id': self.course.id})
+        self.assertTrue(self.client.get(url).json()['is_subscribed'])
+
+
+@override_settings(COURSE_UPDATE_EMAIL_CHUNK_SIZE=2)
+class CourseUpdateEmailTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.course = Course.objects.create(title='test course')
+        for i in range(5):
+            user = User.objects.create(email=f'user{i}@test.ru', password='123')
+            Subscription.objects.create(course=self.course, user=user)
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def tearDown(self) -> None:
+        celery_app.conf.task_always_eager = self.always_eager
+
+    def test_send_course_update_email(self):
+        """Каждый подписчик получает отдельное письмо, адреса читаются одним запросом"""
+        with self.assertNumQueries(2):
+            send_course_update_email(self.course.id)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'user{i}@test.ru' for i in range(5)])
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+
+
+class CourseUpdateDebounceTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+
+    @patch('courses.services.send_course_update_email')
+    def test_updates_are_coalesced(self, task):
+        """Несколько обновлений курса в пределах окна ставят одну задачу рассылки"""
+        for i in range(10):
+            response = self.client.patch(f'/courses/{self.course.id}/', data={'title': f'title {i}'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task.apply_async.assert_called_once_with((self.course.id,), countdown=300)
+        task.delay.assert_not_called()
+
+    @override_settings(COURSE_UPDATE_EMAIL_WINDOW=timedelta(0))
+    @patch('courses.services.send_course_update_email')
+    def test_zero_window_sends_immediately(self, task):
+        """При нулевом окне задача ставится на каждое обновление"""
+        self.client.patch(f'/courses/{self.course.id}/', data={'title': 'first'})
+        self.client.patch(f'/courses/{self.course.id}/', data={'title': 'second'})
+        self.assertEqual(task.delay.call_count, 2)
+
+
+class CheckQueryPlansTestCase(TestCase):
+    options = {'users': 300, 'courses': 20, 'lessons_per_course': 2, 'subscriptions': 300, 'payments': 300}
+
+    def test_reports_every_query_and_rolls_back(self):
+        """Команда выводит статус каждого запроса и откатывает тестовые данные"""
+        out = io.StringIO()
+        call_command('check_query_plans', large_table_rows=10 ** 9, stdout=out, **self.options)
+        self.assertIn('check_inactive_users: ok', out.getvalue())
+        self.assertIn('CourseViewSet.list: ok', out.getvalue())
+        self.assertIn('LessonListAPIView ?pagination=cursor: ok', out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_fails_on_seq_scan_of_large_table(self):
+        """Seq Scan по таблице с количеством строк не меньше --large-table-rows завершает команду ошибкой"""
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', large_table_rows=1, stdout=out, **self.options)
+        self.assertIn('SEQ SCAN', out.getvalue())
+        self.assertIn('COUNT(*) по всей таблице: courses_lesson', out.getvalue())
+
+
+class BenchmarkCompareTestCase(SimpleTestCase):
+
+    def test_summary_and_regressions(self):
+        """Сводка замера содержит перцентили, регрессией считается выход за бюджет и рост числа запросов"""
+        baseline = summarize([i / 1000 for i in range(1, 101)], [2] * 100, 0, 1.0)
+        self.assertEqual((baseline['p50_ms'], baseline['p95_ms'], baseline['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual((baseline['rps'], baseline['queries_per_request']), (100.0, 2.0))
+
+        within_budget = summarize([i * 1.1 / 1000 for i in range(1, 101)], [2] * 100, 0, 1.1)
+        self.assertEqual(compare({'lesson.list': within_budget}, {'lesson.list': baseline}, 0.2), [])
+
+        more_queries = summarize([i / 1000 for i in range(1, 101)], [3] * 100, 0, 1.0)
+        self.assertEqual(compare({'lesson.list': more_queries}, {'lesson.list': baseline}, 0.2),
+                         ['lesson.list: queries_per_request 2.0 -> 3.0'])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTestCase(APITestCase):
+    def setUp(self) -> None:
+        registry.reset()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        Course.objects.create(title='test course', owner=self.user)
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_server_timing_and_metrics(self):
+        """Ответ содержит Server-Timing, гистограммы доступны по имени представления"""
+        response = self.client.get('/courses/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="3 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+
+        metrics = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="CourseViewSet.list",method="GET",status="200"} 1',
+                      metrics)
+        self.assertIn('http_request_db_queries_bucket{view="CourseViewSet.list",le="5"} 1', metrics)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        """При нулевой доле выборки запросы не замеряются"""
+        response = self.client.get('/courses/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('CourseViewSet.list', registry.render())
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_metrics_token(self):
+        """Эндпоинт метрик требует токен, если он задан"""
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_AUTH_TOKEN=None)
+    def test_metrics_closed_by_default(self):
+        """Без токена метрики доступны только сотрудникам или при METRICS_PUBLIC"""
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_200_OK)
+        self.client.force_login(User.objects.create(email='staff@test.ru', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_200_OK)
+
+
+class RequestProfilerTestCase(APITestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'profiles': {'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                         'OPTIONS': {'location': directory.name}},
+        }
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = User.objects.create(email='staff@test.ru', password='123', is_staff=True)
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        Course.objects.create(title='test course', owner=self.staff)
+
+    def authorization(self, user):
+        return f'Bearer {UserTokenObtainPairSerializer.get_token(user).access_token}'
+
+    def test_profile_on_demand(self):
+        """Сотрудник получает отчет с деревом вызовов, планами SQL и выделениями памяти"""
+        auth = self.authorization(self.staff)
+        response = self.client.get('/courses/?profile=cprofile', HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report_id = response['X-Profile-Id']
+
+        response = self.client.get(response['X-Profile-Url'], HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(report['id'], report_id)
+        self.assertEqual(report['view'], 'CourseViewSet.list')
+        self.assertEqual(report['mode'], 'cprofile')
+        self.assertTrue(report['call_tree']['functions'])
+        self.assertGreater(report['sql']['count'], 0)
+        self.assertIn('Scan', report['sql']['slowest'][0]['plan'])
+        self.assertNotIn('params', report['sql']['slowest'][0])
+        self.assertGreater(report['allocations']['peak_kb'], 0)
+
+        response = self.client.get('/profiles/', HTTP_AUTHORIZATION=auth)
+        self.assertEqual([item['id'] for item in response.json()], [report_id])
+
+    def test_profile_requires_staff(self):
+        """Флаг профилирования от обычного пользователя игнорируется, отчеты ему недоступны"""
+        auth = self.authorization(self.user)
+        response = self.client.get('/courses/', HTTP_AUTHORIZATION=auth, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get('/profiles/', HTTP_AUTHORIZATION=auth).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    @override_settings(PROFILE_REPORTS_MAX_COUNT=2)
+    def test_reports_retention(self):
+        """Хранятся только PROFILE_REPORTS_MAX_COUNT последних отчетов"""
+        auth = self.authorization(self.staff)
+        report_ids = [self.client.get('/courses/?profile=1', HTTP_AUTHORIZATION=auth)['X-Profile-Id']
+                      for _ in range(3)]
+        response = self.client.get('/profiles/', HTTP_AUTHORIZATION=auth)
+        self.assertEqual([item['id'] for item in response.json()], report_ids[:0:-1])
+        self.assertEqual(self.client.get(f'/profiles/{report_ids[0]}/', HTTP_AUTHORIZATION=auth).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    def test_explain_is_not_measured(self):
+        """EXPLAIN профилировщика не учитывается в метриках SQL-запросов"""
+        auth = self.authorization(self.staff)
+        response = self.client.get('/courses/?profile=1', HTTP_AUTHORIZATION=auth)
+        report = json.loads(b''.join(self.client.get(response['X-Profile-Url'],
+                                                     HTTP_AUTHORIZATION=auth).streaming_content))
+        self.assertTrue(report['sql']['slowest'][0]['plan'])
+        # Кроме запросов представления - загрузка пользователя для проверки флага профилирования
+        self.assertIn(f'desc="{report["sql"]["count"] + 1} queries"', response['Server-Timing'])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_background_sampling(self):
+        """При доле выборки 1 запросы профилируются в фоне без заголовков в ответе"""
+        response = self.client.get('/courses/', HTTP_AUTHORIZATION=self.authorization(self.user))
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get('/profiles/', HTTP_AUTHORIZATION=self.authorization(self.staff))
+        self.assertEqual(len(response.json()), 1)
+
+
+class TaskMetricsTestCase(APITestCase):
+    def setUp(self) -> None:
+        registry.reset()
+        self.course = Course.objects.create(title='test course')
+
+    def test_queue_wait_and_runtime(self):
+        """Ожидание в очереди считается от заголовка публикации, время выполнения - по состоянию задачи"""
+        send_course_update_email.apply(args=(self.course.id,), headers={PUBLISHED_AT_HEADER: time.time() - 3})
+        with patch('courses.tasks.get_connection', side_effect=ConnectionRefusedError):
+            send_course_update_email_chunk.apply(args=('test course', ['user@test.ru']))
+
+        metrics = registry.render()
+        task = 'courses.tasks.send_course_update_email'
+        self.assertIn(f'celery_task_queue_wait_seconds_bucket{{task="{task}",queue="celery",le="2.5"}} 0', metrics)
+        self.assertIn(f'celery_task_queue_wait_seconds_bucket{{task="{task}",queue="celery",le="5"}} 1', metrics)
+        self.assertIn(f'celery_task_runtime_seconds_count{{task="{task}",state="SUCCESS"}} 1', metrics)
+        chunk_task = 'courses.tasks.send_course_update_email_chunk'
+        self.assertIn(f'celery_task_runtime_seconds_count{{task="{chunk_task}",state="FAILURE"}} 1', metrics)
+        self.assertIn(f'celery_task_failures_total{{task="{chunk_task}",exception="ConnectionRefusedError"}} 1',
+                      metrics)
+
+    def test_queue_backlog(self):
+        """Команда выводит количество сообщений в очередях брокера, пустые очереди из настроек - с нулем"""
+        out = io.StringIO()
+        with celery_app.connection_for_write('memory://') as conn:
+            check_inactive_users.apply_async(connection=conn)
+            check_inactive_users.apply_async(connection=conn)
+            try:
+                call_command('queue_backlog', 'maintenance', 'email', 'missing', '--broker', 'memory://', '--json',
+                             stdout=out)
+            finally:
+                conn.default_channel.queue_purge('maintenance')
+        self.assertEqual(json.loads(out.getvalue())['queues'], {
+            'maintenance': {'messages': 2},
+            'email': {'messages': 0},
+            'missing': None,
+        })
+        self.assertIn('celery_tasks_published_total{task="courses.tasks.check_inactive_users",queue="maintenance"} 2',
+                      registry.render())
+
+
+class WorkerMetricsServerTestCase(SimpleTestCase):
+    @override_settings(METRICS_AUTH_TOKEN='secret', METRICS_PUBLIC=False)
+    def test_requires_token(self):
+        """HTTP-сервер метрик воркера отдает метрики только с токеном"""
+        server = serve_metrics(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}/'
+        with self.assertRaises(HTTPError) as error:
+            urlopen(url)
+        self.assertEqual(error.exception.code, 403)
+        with urlopen(Request(url, headers={'Authorization': 'Bearer secret'})) as response:
+            self.assertEqual(response.status, 200)
+
+
+class TaskRoutingTestCase(SimpleTestCase):
+    def test_routes(self):
+        """Задачи направляются в свои очереди с приоритетом, периодическая обработка событий Stripe - в payments"""
+        router = celery_app.amqp.router
+        route = router.route({}, 'users.tasks.create_payment_checkout_session')
+        self.assertEqual((route['queue'].name, route['queue'].routing_key, route['priority']),
+                         ('payments', 'payments', 0))
+        self.assertEqual(router.route({}, 'courses.tasks.send_course_update_email_chunk')['queue'].name, 'email')
+        for name, entry in settings.CELERY_BEAT_SCHEDULE.items():
+            queue = 'payments' if name == 'process_stripe_events' else 'maintenance'
+            self.assertEqual(router.route({}, entry['task'])['queue'].name, queue)
+        self.assertEqual(router.route({'priority': 1}, 'users.tasks.sync_stripe_catalog')['priority'], 1)
+
+    def test_run_worker_profile(self):
+        """Команда запуска воркера берет очереди, пул и предвыборку из профиля"""
+        out = io.StringIO()
+        call_command('run_worker', '--dry-run', 'email', '-c', '10', stdout=out)
+        command = out.getvalue()
+        self.assertIn('-n email@%h -Q email -P eventlet -c 20 --prefetch-multiplier 4 -c 10', command)
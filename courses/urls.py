@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 
 from .apps import CoursesConfig
 from .views import CourseViewSet, LessonCreateAPIView, LessonListAPIView, LessonRetrieveAPIView, LessonUpdateAPIView, \
-    LessonDestroyAPIView, SubscriptionCreateAPIView
+    LessonDestroyAPIView, SubscriptionCreateAPIView, LessonBulkCreateAPIView, SubscriptionBulkAPIView
 
 app_name = CoursesConfig.name
 
@@ -14,9 +14,11 @@ router.register(r'courses', CourseViewSet, basename='courses')
 urlpatterns = [
     path('', include(router.urls)),
     path('lesson/create/', LessonCreateAPIView.as_view(), name='lesson-create'),
+    path('lesson/bulk-create/', LessonBulkCreateAPIView.as_view(), name='lesson-bulk-create'),
     path('lesson/', LessonListAPIView.as_view(), name='lesson-list'),
     path('lesson/<int:pk>/', LessonRetrieveAPIView.as_view(), name='lesson-retrieve'),
     path('lesson/update/<int:pk>/', LessonUpdateAPIView.as_view(), name='lesson-update'),
     path('lesson/delete/<int:pk>/', LessonDestroyAPIView.as_view(), name='lesson-delete'),
     path('subscription/create/', SubscriptionCreateAPIView.as_view(), name='subscription-create'),
+    path('subscription/bulk/', SubscriptionBulkAPIView.as_view(), name='subscription-bulk'),
 ] + router.urls
@@ -1,22 +1,27 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
 from rest_framework import viewsets, generics, status
-from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from django.http import Http404
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
-from users.permissions import IsOwner, IsModer
+from users.permissions import IsOwner, IsModer, get_user_roles
+from .cache import CachedResponseMixin, invalidate_course, invalidate_subscriptions, bump_versions
 from .models import Course, Lesson, Subscription
 from .paginators import CourseLessonPaginator
-from .serializers import CourseSerializer, LessonSerializer, SubscriptionSerializer
-from courses.tasks import send_course_update_email
+from .serializers import CourseSerializer, LessonSerializer, SubscriptionSerializer, SubscriptionBulkSerializer
+from courses.services import schedule_course_update_email, schedule_stripe_catalog_sync
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
-    ViewSet для управления курсами.
+    ViewSet для управления курсами. Ответы list/retrieve кэшируются.
 
     Атрибуты:
         queryset: QuerySet для всех объектов курса.
         serializer_class: Класс сериализатора для объекта курса.
-        pagination_class: Класс пагинатора для курса и его уроков.
+        pagination_class: Класс пагинатора для курса и его уроков,
+            поддерживает курсорный режим через ?pagination=cursor.
     """
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
@@ -26,20 +31,58 @@ class CourseViewSet(viewsets.ModelViewSet):
         """
         Сохраняет новый курс с текущим пользователем в качестве владельца.
         """
-        serializer.save(owner=self.request.user)
+        course = serializer.save(owner=self.request.user)
+        schedule_stripe_catalog_sync(course_ids=[course.id])
+
+    def get_cache_versions(self):
+        """
+        Возвращает версии, от которых зависит закэшированный ответ.
+        """
+        subscriptions = f'subscriptions:{self.request.user.pk}'
+        if self.action == 'list':
+            return ['course-list', subscriptions]
+        return [f'course:{self.kwargs["pk"]}', subscriptions]
 
     def get_queryset(self):
         """
         Возвращает QuerySet в зависимости от роли пользователя.
         Если пользователь суперпользователь или модератор, возвращает все курсы.
         Иначе возвращает только курсы текущего пользователя.
+
+        Курсы аннотируются количеством уроков и признаком подписки текущего
+        пользователя, а уроки подгружаются одним запросом, чтобы сериализатор
+        не обращался к базе для каждого курса. Аннотации, подгрузка и столбцы
+        ограничиваются полями, запрошенными через ?fields= и ?expand=.
         """
         if getattr(self, 'swagger_fake_view', False):
             return Course.objects.none()
         user = self.request.user
-        if user.is_superuser or user.groups.filter(name='Модераторы').exists():
-            return Course.objects.all()
-        return Course.objects.filter(owner=user)
+        fields = self.get_serializer().fields
+        queryset = Course.objects.order_by('pk')
+        if 'lessons_amount' in fields:
+            queryset = queryset.annotate(lessons_count=Count('lessons', distinct=True))
+        if 'is_subscribed' in fields:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(user=user, course=OuterRef('pk')))
+            )
+        if 'lessons' in fields:
+            queryset = queryset.prefetch_related('lessons')
+        if self.request.method in SAFE_METHODS:
+            model_fields = [field.name for field in Course._meta.concrete_fields if field.name in fields]
+            queryset = queryset.only('pk', *model_fields)
+        return self.filter_visible(queryset)
+
+    def filter_visible(self, queryset):
+        """
+        Оставляет курсы, доступные текущему пользователю.
+        """
+        user = self.request.user
+        if user.is_superuser or 'Модераторы' in get_user_roles(self.request):
+            return queryset
+        return queryset.filter(owner=user)
+
+    def get_permission_queryset(self):
+        return self.filter_visible(Course.objects.only('id', 'owner'))
 
     def get_permissions(self):
         """
@@ -59,10 +102,14 @@ class CourseViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         """
-        Обновляет курс и отправляет уведомления подписчикам.
+        Обновляет курс и планирует уведомление подписчиков.
+        Частые правки курса объединяются в одно уведомление.
         """
+        old_title = serializer.instance.title
         course = serializer.save()
-        send_course_update_email.delay(course.id)
+        schedule_course_update_email(course.id)
+        if course.title != old_title:
+            schedule_stripe_catalog_sync(course_ids=[course.id])
 
 
 class LessonCreateAPIView(generics.CreateAPIView):
@@ -82,23 +129,79 @@ class LessonCreateAPIView(generics.CreateAPIView):
         """
         Сохраняет новый урок с текущим пользователем в качестве владельца.
         """
-        serializer.save(owner=self.request.user)
+        lesson = serializer.save(owner=self.request.user)
+        schedule_stripe_catalog_sync(lesson_ids=[lesson.id])
+
+
+class LessonBulkCreateAPIView(generics.CreateAPIView):
+    """
+    APIView для создания списка уроков одним запросом.
+
+    Каждый элемент проверяется LessonSerializer, курсы загружаются одним
+    запросом, а уроки сохраняются одним bulk_create в транзакции. Если хотя
+    бы один элемент не прошел проверку, ничего не сохраняется и возвращается
+    список ошибок по индексам элементов.
+
+    Атрибуты:
+        queryset: QuerySet для всех объектов урока.
+        serializer_class: Класс сериализатора для объекта урока.
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    queryset = Lesson.objects.all()
+    serializer_class = LessonSerializer
+    permission_classes = [IsAuthenticated, ~IsModer]
+
+    def get_prefetched_courses(self, items):
+        """
+        Загружает одним запросом курсы, на которые ссылаются элементы запроса.
+        """
+        course_ids = set()
+        if isinstance(items, list):
+            for item in items:
+                try:
+                    course_ids.add(int(item['course']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return Course.objects.in_bulk(course_ids)
+
+    def create(self, request, *args, **kwargs):
+        context = self.get_serializer_context()
+        context['prefetched'] = {Course: self.get_prefetched_courses(request.data)}
+        serializer = self.get_serializer_class()(data=request.data, many=True, context=context,
+                                                 max_length=settings.LESSON_BULK_CREATE_MAX_ITEMS)
+        if not serializer.is_valid():
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        lessons = [Lesson(**{**attrs, 'owner': request.user}) for attrs in serializer.validated_data]
+        with transaction.atomic():
+            Lesson.objects.bulk_create(lessons)
 
+        bump_versions('lesson-list')
+        for course_id in {lesson.course_id for lesson in lessons}:
+            invalidate_course(course_id)
+        schedule_stripe_catalog_sync(lesson_ids=[lesson.id for lesson in lessons])
+        return Response(self.get_serializer(lessons, many=True).data, status=status.HTTP_201_CREATED)
 
-class LessonListAPIView(generics.ListAPIView):
+
+class LessonListAPIView(CachedResponseMixin, generics.ListAPIView):
     """
-    APIView для получения списка уроков.
+    APIView для получения списка уроков. Ответы кэшируются.
 
     Атрибуты:
         serializer_class: Класс сериализатора для объекта урока.
         queryset: QuerySet для всех объектов урока.
         permission_classes: Разрешения для доступа к этому представлению.
-        pagination_class: Класс пагинатора для уроков.
+        pagination_class: Класс пагинатора для уроков,
+            поддерживает курсорный режим через ?pagination=cursor.
     """
     serializer_class = LessonSerializer
-    queryset = Lesson.objects.all()
+    queryset = Lesson.objects.order_by('id')
     permission_classes = [IsAuthenticated]
     pagination_class = CourseLessonPaginator
+    cache_per_user = False
+
+    def get_cache_versions(self):
+        return ['lesson-list']
 
 
 class LessonUpdateAPIView(generics.UpdateAPIView):
@@ -114,6 +217,15 @@ class LessonUpdateAPIView(generics.UpdateAPIView):
     queryset = Lesson.objects.all()
     permission_classes = [IsAuthenticated, IsModer | IsOwner]
 
+    def perform_update(self, serializer):
+        """
+        Обновляет урок. При переименовании урока обновляет название продукта Stripe.
+        """
+        old_title = serializer.instance.title
+        lesson = serializer.save()
+        if lesson.title != old_title:
+            schedule_stripe_catalog_sync(lesson_ids=[lesson.id])
+
 
 class LessonDestroyAPIView(generics.DestroyAPIView):
     """
@@ -129,9 +241,10 @@ class LessonDestroyAPIView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated, IsOwner]
 
 
-class LessonRetrieveAPIView(generics.RetrieveAPIView):
+class LessonRetrieveAPIView(CachedResponseMixin, generics.RetrieveAPIView):
     """
-    APIView для получения одного урока.
+    APIView для получения одного урока. Ответы кэшируются отдельно для
+    каждого пользователя, так как доступ к уроку зависит от роли и владельца.
 
     Атрибуты:
         serializer_class: Класс сериализатора для объекта урока.
@@ -142,6 +255,12 @@ class LessonRetrieveAPIView(generics.RetrieveAPIView):
     queryset = Lesson.objects.all()
     permission_classes = [IsAuthenticated, IsModer | IsOwner]
 
+    def get_cache_versions(self):
+        return [f'lesson:{self.kwargs["pk"]}']
+
+    def get_permission_queryset(self):
+        return Lesson.objects.only('id', 'owner')
+
 
 class SubscriptionCreateAPIView(generics.CreateAPIView):
     """
@@ -168,14 +287,49 @@ class SubscriptionCreateAPIView(generics.CreateAPIView):
             Response: Ответ с сообщением о результате операции.
         """
         user = request.user
-        course_id = request.data.get('course_id')
-        course = get_object_or_404(Course, id=course_id)
-        subscription, created = Subscription.objects.get_or_create(user=user, course=course)
+        try:
+            course_id = int(request.data.get('course_id'))
+        except (TypeError, ValueError):
+            raise Http404
+        subscribed = Subscription.objects.toggle(user.id, course_id)
+        if subscribed is None:
+            raise Http404
 
-        if not created:
-            subscription.delete()
-            message = 'Подписка удалена'
-        else:
+        if subscribed:
             message = 'Подписка добавлена'
+        else:
+            message = 'Подписка удалена'
+        invalidate_subscriptions(user.id)
 
         return Response({"message": message}, status=status.HTTP_201_CREATED)
+
+
+class SubscriptionBulkAPIView(generics.GenericAPIView):
+    """
+    APIView для подписки на несколько курсов или отмены подписок одним запросом.
+
+    Атрибуты:
+        serializer_class: Класс сериализатора входных данных.
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    serializer_class = SubscriptionBulkSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Подписывает (action=subscribe) или отписывает (action=unsubscribe)
+        текущего пользователя от курсов из course_ids.
+
+        Возвращает:
+            Response: id курсов, для которых подписка была изменена.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user
+        course_ids = set(serializer.validated_data['course_ids'])
+        if serializer.validated_data['action'] == 'subscribe':
+            result = {'subscribed': Subscription.objects.subscribe_many(user.id, course_ids)}
+        else:
+            result = {'unsubscribed': Subscription.objects.unsubscribe_many(user.id, course_ids)}
+        invalidate_subscriptions(user.id)
+        return Response(result, status=status.HTTP_200_OK)
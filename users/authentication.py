@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User
+from users.permissions import ROLES_CLAIM
+
+TOKEN_USER_CLAIMS = ('email', 'is_active', 'is_staff', 'is_superuser')
+USER_ACTIVE_KEY = 'auth:user-active:{}'
+
+
+def set_users_active_state(user_ids, is_active):
+    """
+    Записывает состояние активности пользователей в кэш, чтобы деактивация
+    вступала в силу сразу, не дожидаясь истечения USER_ACTIVE_CHECK_TTL.
+    """
+    cache.set_many(
+        {USER_ACTIVE_KEY.format(user_id): is_active for user_id in user_ids},
+        timeout=getattr(settings, 'USER_ACTIVE_CHECK_TTL', 60),
+    )
+
+
+def is_user_active(user_id):
+    """
+    Проверяет активность пользователя с коротким кэшированием в Redis:
+    база данных опрашивается не чаще одного раза за USER_ACTIVE_CHECK_TTL.
+    """
+    key = USER_ACTIVE_KEY.format(user_id)
+    is_active = cache.get(key)
+    if is_active is None:
+        is_active = User.objects.filter(pk=user_id, is_active=True).exists()
+        set_users_active_state([user_id], is_active)
+    return is_active
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    JWT-аутентификация с режимом без загрузки пользователя из базы.
+
+    При JWT_STATELESS_AUTH пользователь собирается из подписанных claims
+    токена (id, email, is_active, is_staff, is_superuser, roles). Остальные
+    поля модели остаются отложенными и загружаются из базы при первом
+    обращении к ним. Токены без нужных claims обрабатываются как обычно.
+    """
+
+    def get_user(self, validated_token):
+        if not getattr(settings, 'JWT_STATELESS_AUTH', False):
+            return super().get_user(validated_token)
+        if not all(claim in validated_token for claim in TOKEN_USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if not validated_token['is_active'] or not is_user_active(user_id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        claims = {claim: validated_token[claim] for claim in TOKEN_USER_CLAIMS}
+        claims[api_settings.USER_ID_FIELD] = user_id
+        fields = [field for field in User._meta.concrete_fields if field.attname in claims]
+        user = User.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in fields],
+            [claims[field.attname] for field in fields],
+        )
+        if ROLES_CLAIM in validated_token:
+            user.token_roles = frozenset(validated_token[ROLES_CLAIM])
+        return user
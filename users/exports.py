@@ -0,0 +1,63 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = (
+    'id', 'user', 'payment_date', 'course', 'lesson', 'amount', 'payment_method',
+    'stripe_product_id', 'stripe_price_id', 'stripe_session_id', 'stripe_checkout_url',
+)
+
+
+class Echo:
+    """
+    Псевдобуфер для csv.writer: возвращает записанную строку вместо хранения.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in (row[field] for field in fields)
+        ])
+
+
+def ndjson_lines(rows, fields):
+    for row in rows:
+        yield json.dumps({field: row[field] for field in fields}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def encode_chunks(lines, lines_per_chunk, compress=False):
+    """
+    Склеивает строки в блоки по lines_per_chunk и при необходимости сжимает
+    их gzip, не держа в памяти больше одного блока.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) == lines_per_chunk:
+            data = ''.join(buffer).encode()
+            buffer = []
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = ''.join(buffer).encode()
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
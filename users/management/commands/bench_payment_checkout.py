@@ -0,0 +1,49 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from courses.models import Course
+from users.models import User
+from users.stripe_stub import stripe_stub
+from users.tasks import create_payment_checkout_session
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время ответа создания платежа с синхронным созданием сессии Stripe '
+            'и с асинхронным через задачу, используя локальную замену Stripe с задержкой. '
+            'Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.2, help='Задержка ответа Stripe, секунды')
+
+    def handle(self, *args, **options):
+        with stripe_stub(latency=options['latency']) as stub, transaction.atomic():
+            user = User.objects.create(email='bench-checkout@example.com')
+            course = Course.objects.create(title='bench course', owner=user)
+            client = APIClient()
+            client.force_authenticate(user=user)
+            data = {'user': user.id, 'course': course.id, 'amount': '10.00', 'payment_method': 'transfer'}
+
+            results = {}
+            for mode in ('sync', 'async'):
+                timings = []
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    response = client.post('/users/payment/create/', data)
+                    if mode == 'sync':
+                        # Прежнее поведение: сессия создается внутри запроса
+                        create_payment_checkout_session(response.data['id'])
+                    timings.append(time.perf_counter() - started)
+                results[mode] = timings
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'stripe latency={options["latency"]}s stripe calls={len(stub.requests)}')
+        for mode, timings in results.items():
+            self.stdout.write(
+                f'{mode}: mean={statistics.mean(timings) * 1000:.1f}ms '
+                f'p50={statistics.median(timings) * 1000:.1f}ms max={max(timings) * 1000:.1f}ms'
+            )
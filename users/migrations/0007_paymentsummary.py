@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_course_lesson_subscription_indexes'),
+        ('users', '0006_payment_user_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('payment_method', models.CharField(choices=[('cash', 'Наличные'), ('transfer', 'Перевод на счет')], max_length=8, verbose_name='способ оплаты')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='сумма платежей')),
+                ('payments_count', models.IntegerField(default=0, verbose_name='количество платежей')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course', verbose_name='курс')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.lesson', verbose_name='урок')),
+            ],
+            options={
+                'verbose_name': 'сводка платежей',
+                'verbose_name_plural': 'сводки платежей',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'course', 'lesson', 'payment_method'), name='unique_payment_summary_key', nulls_distinct=False),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_course_lesson_subscription_indexes'),
+        ('users', '0007_paymentsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.CharField(max_length=500, verbose_name='ID продукта в Stripe')),
+                ('name', models.CharField(max_length=200, verbose_name='название продукта в Stripe')),
+                ('course', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stripe_product', to='courses.course', verbose_name='курс')),
+                ('lesson', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stripe_product', to='courses.lesson', verbose_name='урок')),
+            ],
+            options={
+                'verbose_name': 'продукт Stripe',
+                'verbose_name_plural': 'продукты Stripe',
+            },
+        ),
+        migrations.CreateModel(
+            name='StripePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='сумма')),
+                ('price_id', models.CharField(max_length=500, verbose_name='ID цены в Stripe')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='users.stripeproduct', verbose_name='продукт')),
+            ],
+            options={
+                'verbose_name': 'цена Stripe',
+                'verbose_name_plural': 'цены Stripe',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stripeprice',
+            constraint=models.UniqueConstraint(fields=('product', 'amount'), name='unique_stripe_price_product_amount'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+def mark_existing_sessions_open(apps, schema_editor):
+    Payment = apps.get_model('users', 'Payment')
+    Payment.objects.filter(stripe_session_id__isnull=False).update(status='open')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_stripe_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Создается сессия оплаты'), ('open', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='статус'),
+        ),
+        migrations.RunPython(mark_existing_sessions_open, migrations.RunPython.noop),
+    ]
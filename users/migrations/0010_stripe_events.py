@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_course_lesson_subscription_indexes'),
+        ('users', '0009_payment_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID события в Stripe')),
+                ('type', models.CharField(max_length=100, verbose_name='тип события')),
+                ('session_id', models.CharField(max_length=500, verbose_name='ID сессии в Stripe')),
+                ('payment_status', models.CharField(choices=[('pending', 'Создается сессия оплаты'), ('open', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка')], max_length=10, verbose_name='статус платежа')),
+                ('created', models.DateTimeField(verbose_name='время создания события')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='время получения события')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='время обработки события')),
+            ],
+            options={
+                'verbose_name': 'событие Stripe',
+                'verbose_name_plural': 'события Stripe',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('stripe_session_id__isnull', False)), fields=['stripe_session_id'], name='payment_stripe_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created', 'id'], name='stripe_event_unprocessed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['received_at'], name='stripe_event_received_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:05
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_payment_summaries(apps, schema_editor):
+    """
+    Пересчитывает сводки оплаченных платежей за всю историю: сигналы
+    поддерживают сводку только для платежей, измененных после
+    0007_paymentsummary, а периодическая сверка охватывает последние дни.
+    """
+    Payment = apps.get_model('users', 'Payment')
+    PaymentSummary = apps.get_model('users', 'PaymentSummary')
+    totals = Payment.objects.filter(status='paid').annotate(day=TruncDate('payment_date')).values(
+        'day', 'course', 'lesson', 'payment_method',
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    PaymentSummary.objects.all().delete()
+    PaymentSummary.objects.bulk_create(
+        (PaymentSummary(day=row['day'], course_id=row['course'], lesson_id=row['lesson'],
+                        payment_method=row['payment_method'], total_amount=row['total'],
+                        payments_count=row['count'])
+         for row in totals.iterator(chunk_size=5000)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_stripe_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_payment_summaries, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,13 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone as dj_timezone
 
 from courses.models import Course, Lesson
 
@@ -21,6 +28,11 @@ class User(AbstractUser):
         verbose_name = 'Пользователь'
         verbose_name_plural = "Пользователи"
         ordering = ['email']
+        indexes = [
+            models.Index(fields=['last_login'], condition=Q(is_active=True), name='user_active_last_login_idx'),
+            models.Index(fields=['date_joined'], condition=Q(is_active=True, last_login__isnull=True),
+                         name='user_never_logged_in_idx'),
+        ]
 
 
 class Payment(models.Model):
@@ -28,6 +40,16 @@ class Payment(models.Model):
         ('cash', 'Наличные'),
         ('transfer', 'Перевод на счет'),
     ]
+    STATUS_PENDING = 'pending'
+    STATUS_OPEN = 'open'
+    STATUS_PAID = 'paid'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Создается сессия оплаты'),
+        (STATUS_OPEN, 'Ожидает оплаты'),
+        (STATUS_PAID, 'Оплачен'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payments', verbose_name='пользователь')
     payment_date = models.DateTimeField(auto_now_add=True, verbose_name='дата оплаты')
@@ -39,6 +61,7 @@ class Payment(models.Model):
     stripe_price_id = models.CharField(max_length=500, blank=True, null=True, verbose_name='ID цены в Stripe')
     stripe_session_id = models.CharField(max_length=500, blank=True, null=True, verbose_name='ID сессии в Stripe')
     stripe_checkout_url = models.URLField(max_length=500, blank=True, null=True, verbose_name='URL страницы оплаты в Stripe')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='статус')
 
     def __str__(self):
         return f'{self.user} - {self.amount}'
@@ -46,4 +69,190 @@ class Payment(models.Model):
     class Meta:
         verbose_name = 'платеж'
         verbose_name_plural = 'платежи'
+        indexes = [
+            models.Index(fields=['user', '-payment_date'], name='payment_user_date_idx'),
+            models.Index(fields=['-payment_date'], name='payment_date_idx'),
+            models.Index(fields=['amount'], name='payment_amount_idx'),
+            models.Index(fields=['payment_method', '-payment_date'], name='payment_method_date_idx'),
+            models.Index(fields=['course', '-payment_date'], condition=Q(course__isnull=False),
+                         name='payment_course_date_idx'),
+            models.Index(fields=['lesson', '-payment_date'], condition=Q(lesson__isnull=False),
+                         name='payment_lesson_date_idx'),
+            models.Index(fields=['stripe_session_id'], condition=Q(stripe_session_id__isnull=False),
+                         name='payment_stripe_session_idx'),
+        ]
+
+
+
+class PaymentSummaryManager(models.Manager):
+
+    def apply(self, day, course_id, lesson_id, payment_method, amount, count):
+        """
+        Добавляет к сводке за день сумму и количество платежей одним запросом.
+        Для вычитания передаются отрицательные amount и count; вычитание
+        не создает строк, поэтому не ссылается на уже удаленные курс или урок
+        при каскадном удалении.
+        """
+        table = self.model._meta.db_table
+        if count < 0:
+            self.filter(day=day, course_id=course_id, lesson_id=lesson_id, payment_method=payment_method).update(
+                total_amount=F('total_amount') + amount, payments_count=F('payments_count') + count,
+            )
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (day, course_id, lesson_id, payment_method, total_amount, payments_count)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT ON CONSTRAINT unique_payment_summary_key DO UPDATE SET
+                    total_amount = {table}.total_amount + EXCLUDED.total_amount,
+                    payments_count = {table}.payments_count + EXCLUDED.payments_count
+                """,
+                [day, course_id, lesson_id, payment_method, amount, count],
+            )
+
+    def apply_payments(self, payments, sign=1):
+        """
+        Добавляет к сводкам (sign=1) или вычитает из них (sign=-1) платежи,
+        заданные кортежами (payment_date, course_id, lesson_id, payment_method,
+        amount), одним запросом на ключ сводки.
+        """
+        totals = defaultdict(lambda: [Decimal('0'), 0])
+        for payment_date, course_id, lesson_id, payment_method, amount in payments:
+            total = totals[(dj_timezone.localdate(payment_date), course_id, lesson_id, payment_method)]
+            total[0] += Decimal(str(amount))
+            total[1] += 1
+        for key, (amount, count) in totals.items():
+            self.apply(*key, sign * amount, sign * count)
+
+    def reconcile(self, date_from, date_to):
+        """
+        Пересчитывает сводки за дни с date_from по date_to включительно
+        по оплаченным платежам. Возвращает количество записанных строк сводки.
+        """
+        totals = Payment.objects.annotate(day=TruncDate('payment_date')).filter(
+            day__gte=date_from, day__lte=date_to, status=Payment.STATUS_PAID,
+        ).values('day', 'course', 'lesson', 'payment_method').annotate(
+            total=Sum('amount'), count=Count('id'),
+        ).order_by()
+        with transaction.atomic():
+            self.filter(day__gte=date_from, day__lte=date_to).delete()
+            created = self.bulk_create(
+                self.model(day=row['day'], course_id=row['course'], lesson_id=row['lesson'],
+                           payment_method=row['payment_method'], total_amount=row['total'],
+                           payments_count=row['count'])
+                for row in totals
+            )
+        return len(created)
+
+
+class PaymentSummary(models.Model):
+    day = models.DateField(verbose_name='день')
+    course = models.ForeignKey(Course, null=True, blank=True, on_delete=models.CASCADE, verbose_name='курс')
+    lesson = models.ForeignKey(Lesson, null=True, blank=True, on_delete=models.CASCADE, verbose_name='урок')
+    payment_method = models.CharField(max_length=8, choices=Payment.PAYMENT_METHOD_CHOICES, verbose_name='способ оплаты')
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='сумма платежей')
+    payments_count = models.IntegerField(default=0, verbose_name='количество платежей')
+
+    objects = PaymentSummaryManager()
+
+    def __str__(self):
+        return f'{self.day} - {self.total_amount}'
+
+    class Meta:
+        verbose_name = 'сводка платежей'
+        verbose_name_plural = 'сводки платежей'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'course', 'lesson', 'payment_method'], nulls_distinct=False,
+                                    name='unique_payment_summary_key'),
+        ]
+
+
+class StripeProduct(models.Model):
+    course = models.OneToOneField(Course, null=True, blank=True, on_delete=models.CASCADE, related_name='stripe_product',
+                                  verbose_name='курс')
+    lesson = models.OneToOneField(Lesson, null=True, blank=True, on_delete=models.CASCADE, related_name='stripe_product',
+                                  verbose_name='урок')
+    product_id = models.CharField(max_length=500, verbose_name='ID продукта в Stripe')
+    name = models.CharField(max_length=200, verbose_name='название продукта в Stripe')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'продукт Stripe'
+        verbose_name_plural = 'продукты Stripe'
+
+
+class StripePrice(models.Model):
+    product = models.ForeignKey(StripeProduct, on_delete=models.CASCADE, related_name='prices', verbose_name='продукт')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='сумма')
+    price_id = models.CharField(max_length=500, verbose_name='ID цены в Stripe')
+
+    def __str__(self):
+        return f'{self.product} - {self.amount}'
+
+    class Meta:
+        verbose_name = 'цена Stripe'
+        verbose_name_plural = 'цены Stripe'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'amount'], name='unique_stripe_price_product_amount'),
+        ]
 
+
+class StripeEvent(models.Model):
+    """
+    Полученное событие Stripe, ожидающее применения к платежам.
+
+    Уникальный event_id отбрасывает повторные доставки одного события.
+
+    Атрибуты:
+        PAYMENT_STATUSES (dict): Тип события -> статус платежа после него.
+    """
+    PAYMENT_STATUSES = {
+        'checkout.session.completed': Payment.STATUS_PAID,
+        'checkout.session.async_payment_succeeded': Payment.STATUS_PAID,
+        'checkout.session.async_payment_failed': Payment.STATUS_FAILED,
+        'checkout.session.expired': Payment.STATUS_FAILED,
+    }
+
+    event_id = models.CharField(max_length=255, unique=True, verbose_name='ID события в Stripe')
+    type = models.CharField(max_length=100, verbose_name='тип события')
+    session_id = models.CharField(max_length=500, verbose_name='ID сессии в Stripe')
+    payment_status = models.CharField(max_length=10, choices=Payment.STATUS_CHOICES, verbose_name='статус платежа')
+    created = models.DateTimeField(verbose_name='время создания события')
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name='время получения события')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='время обработки события')
+
+    @classmethod
+    def from_payload(cls, event):
+        """
+        Создает объект по данным события из вебхука. Возвращает None для событий,
+        не меняющих статус платежа, в том числе для завершенной сессии,
+        оплата по которой еще не поступила.
+        """
+        payment_status = cls.PAYMENT_STATUSES.get(event.get('type'))
+        session = event.get('data', {}).get('object', {})
+        if payment_status is None or not session.get('id'):
+            return None
+        if event['type'] == 'checkout.session.completed' and session.get('payment_status') == 'unpaid':
+            return None
+        return cls(
+            event_id=event['id'],
+            type=event['type'],
+            session_id=session['id'],
+            payment_status=payment_status,
+            created=datetime.fromtimestamp(event['created'], tz=timezone.utc),
+        )
+
+    def __str__(self):
+        return self.event_id
+
+    class Meta:
+        verbose_name = 'событие Stripe'
+        verbose_name_plural = 'события Stripe'
+        indexes = [
+            models.Index(fields=['created', 'id'], condition=Q(processed_at__isnull=True),
+                         name='stripe_event_unprocessed_idx'),
+            models.Index(fields=['received_at'], name='stripe_event_received_idx'),
+        ]
@@ -1,11 +1,37 @@
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
+ROLES_CLAIM = 'roles'
+
+
+def get_user_roles(request):
+    """
+    Возвращает множество названий групп текущего пользователя.
+
+    Роли вычисляются один раз за запрос и запоминаются на объекте запроса. Если включен ROLES_FROM_TOKEN и access-токен содержит
+    claim с ролями, запрос к таблице групп не выполняется.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(request, '_roles_cache', None)
+    if roles is None:
+        token = request.auth
+        if getattr(user, 'token_roles', None) is not None:
+            roles = user.token_roles
+        elif getattr(settings, 'ROLES_FROM_TOKEN', False) and token is not None and ROLES_CLAIM in token:
+            roles = frozenset(token[ROLES_CLAIM])
+        else:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+        request._roles_cache = roles
+    return roles
+
 
 class IsModer(BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='moderators').exists()
+        return 'moderators' in get_user_roles(request)
 
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
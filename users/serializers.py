@@ -1,16 +1,85 @@
+from django.db.models import Count, Max, Sum
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from courses.serializers import get_query_param_list
 from users.models import User, Payment
+from users.permissions import ROLES_CLAIM
 
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
+        read_only_fields = ('status',)
+
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ('id', 'status', 'stripe_checkout_url')
+
+
+class PaymentsSummarySerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    last_payment_date = serializers.DateTimeField(allow_null=True)
 
 
 class UserSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор пользователя.
+
+    Поддерживает параметр запроса ?expand=payments - встроить последние
+    платежи пользователя (не больше USER_PAYMENTS_EMBED_LIMIT). Сводка
+    payments_summary учитывает только оплаченные платежи.
+    """
     payments = PaymentSerializer(many=True, read_only=True)
+    payments_summary = serializers.SerializerMethodField()
+
+    expandable_fields = ('payments',)
 
     class Meta:
         model = User
         fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = get_query_param_list(self.context.get('request'), 'expand') or set()
+        for field_name in self.expandable_fields:
+            if field_name not in expand:
+                self.fields.pop(field_name)
+
+    def get_payments_summary(self, instance):
+        # Значения берутся из аннотаций UserViewSet.get_queryset,
+        # запрос к базе выполняется только для неаннотированных объектов.
+        if hasattr(instance, 'payments_count'):
+            summary = {
+                'count': instance.payments_count,
+                'total': instance.payments_total,
+                'last_payment_date': instance.last_payment_date,
+            }
+        else:
+            summary = instance.payments.filter(status=Payment.STATUS_PAID).aggregate(
+                count=Count('id'), total=Sum('amount'), last_payment_date=Max('payment_date'),
+            )
+        summary['total'] = summary['total'] or 0
+        return PaymentsSummarySerializer(summary).data
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Добавляет в токен claim с названиями групп пользователя и основные
+    поля пользователя, чтобы проверки ролей и аутентификация в режиме
+    JWT_STATELESS_AUTH не обращались к базе данных.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ROLES_CLAIM] = list(user.groups.values_list('name', flat=True))
+        token['email'] = user.email
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
@@ -1,25 +1,30 @@
 import stripe
+from django.conf import settings
+from django.core.cache import cache
 
-from config.settings import STRIPE_API_KEY
+from users.models import StripePrice, StripeProduct
 
-stripe.api_key = STRIPE_API_KEY
 
-
-def create_stripe_product(name):
-    product = stripe.Product.create(name=name)
+def create_stripe_product(name, idempotency_key=None):
+    product = stripe.Product.create(name=name, idempotency_key=idempotency_key)
     return product['id']
 
 
-def create_stripe_price(product_id, amount):
+def update_stripe_product(product_id, name):
+    stripe.Product.modify(product_id, name=name)
+
+
+def create_stripe_price(product_id, amount, idempotency_key=None):
     price = stripe.Price.create(
         product=product_id,
         unit_amount=int(amount * 100),
-        currency='usd'
+        currency='usd',
+        idempotency_key=idempotency_key,
     )
     return price['id']
 
 
-def create_stripe_checkout_session(price_id, success_url, cancel_url):
+def create_stripe_checkout_session(price_id, success_url, cancel_url, idempotency_key=None):
     session = stripe.checkout.Session.create(
         payment_method_types=['card'],
         line_items=[{
@@ -29,5 +34,69 @@ def create_stripe_checkout_session(price_id, success_url, cancel_url):
         mode='payment',
         success_url=success_url,
         cancel_url=cancel_url,
+        idempotency_key=idempotency_key,
     )
     return session['id'], session['url']
+
+
+def sync_stripe_product(course=None, lesson=None, product=None, idempotency_key=None):
+    """
+    Создает продукт Stripe для курса или урока либо обновляет его название,
+    если курс или урок были переименованы. Возвращает StripeProduct.
+    """
+    item = course or lesson
+    if product is None:
+        product = StripeProduct.objects.filter(course=course, lesson=lesson).first()
+    if product is None:
+        product_id = create_stripe_product(item.title, idempotency_key=idempotency_key)
+        product, _ = StripeProduct.objects.get_or_create(
+            course=course, lesson=lesson, defaults={'product_id': product_id, 'name': item.title},
+        )
+    elif product.name != item.title:
+        update_stripe_product(product.product_id, item.title)
+        product.name = item.title
+        product.save(update_fields=['name'])
+    return product
+
+
+def get_stripe_price(amount, course=None, lesson=None, idempotency_key=None):
+    """
+    Возвращает (product_id, price_id) для оплаты курса или урока на сумму amount.
+
+    Продукты и цены хранятся в базе и переиспользуются, поэтому запросы
+    к Stripe выполняются только для новых курсов, уроков и сумм.
+    idempotency_key используется как префикс ключей идемпотентности.
+    """
+    price = StripePrice.objects.select_related('product').filter(
+        product__course=course, product__lesson=lesson, amount=amount,
+    ).first()
+    if price is None:
+        product = sync_stripe_product(
+            course=course, lesson=lesson, idempotency_key=idempotency_key and f'{idempotency_key}-product',
+        )
+        price_id = create_stripe_price(
+            product.product_id, amount, idempotency_key=idempotency_key and f'{idempotency_key}-price',
+        )
+        price, _ = StripePrice.objects.get_or_create(product=product, amount=amount, defaults={'price_id': price_id})
+    return price.product.product_id, price.price_id
+
+
+def schedule_stripe_events_processing():
+    """
+    Планирует обработку полученных событий Stripe.
+
+    События, пришедшие в течение STRIPE_EVENTS_WINDOW, обрабатываются одной
+    задачей: первое событие ставит задачу с отложенным запуском и ключ
+    в кэше, последующие видят ключ и ничего не ставят. Ключ виден всем
+    процессам только при общем кэше (CACHE_REDIS_URL).
+    """
+    from users.tasks import process_stripe_events
+
+    window = int(settings.STRIPE_EVENTS_WINDOW.total_seconds())
+    if window <= 0:
+        process_stripe_events.delay()
+        return True
+    if not cache.add('stripe-events-processing', True, timeout=window):
+        return False
+    process_stripe_events.apply_async(countdown=window)
+    return True
@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import Payment, PaymentSummary
+
+
+def get_summary_row(payment):
+    return payment.payment_date, payment.course_id, payment.lesson_id, payment.payment_method, payment.amount
+
+
+@receiver(pre_save, sender=Payment)
+def remember_previous_summary_row(sender, instance, **kwargs):
+    """
+    Запоминает вклад изменяемого платежа в сводку до сохранения:
+    в сводке учитываются только оплаченные платежи.
+    """
+    instance._previous_summary = None
+    if instance._state.adding or instance.pk is None:
+        return
+    instance._previous_summary = Payment.objects.filter(pk=instance.pk, status=Payment.STATUS_PAID).values_list(
+        'payment_date', 'course_id', 'lesson_id', 'payment_method', 'amount',
+    ).first()
+
+
+@receiver(post_save, sender=Payment)
+def update_summary_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_summary', None)
+    if previous is not None:
+        PaymentSummary.objects.apply_payments([previous], sign=-1)
+    if instance.status == Payment.STATUS_PAID:
+        PaymentSummary.objects.apply_payments([get_summary_row(instance)])
+
+
+@receiver(post_delete, sender=Payment)
+def update_summary_on_delete(sender, instance, **kwargs):
+    if instance.status == Payment.STATUS_PAID:
+        PaymentSummary.objects.apply_payments([get_summary_row(instance)], sign=-1)
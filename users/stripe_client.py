@@ -0,0 +1,118 @@
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from config.metrics import counter, histogram
+
+STRIPE_ID_RE = re.compile(r'/[a-z]+_[A-Za-z0-9_]+')
+
+
+def get_endpoint(method, url):
+    """
+    Возвращает имя эндпоинта для метрик: метод и путь без домена,
+    параметров запроса и идентификаторов объектов Stripe.
+    """
+    path = requests.utils.urlparse(url).path
+    return f'{method.upper()} {STRIPE_ID_RE.sub("/{id}", path)}'
+
+
+STRIPE_REQUEST_DURATION = histogram('stripe_request_duration_seconds', 'Время попытки запроса к Stripe API',
+                                    ('endpoint',))
+STRIPE_REQUEST_ERRORS = counter('stripe_request_errors',
+                                'Количество попыток запроса к Stripe API с сетевой ошибкой или ответом 5xx',
+                                ('endpoint',))
+
+
+def create_session(pool_size):
+    """
+    Создает сессию requests с ограниченным пулом keep-alive соединений.
+    Повторы выполняет клиент Stripe, поэтому у адаптера они отключены.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PooledRequestsClient(stripe.RequestsClient):
+    """
+    HTTP-клиент Stripe с общей для всех потоков сессией и пулом соединений.
+
+    Каждая попытка запроса замеряется в метриках по эндпоинтам,
+    паузы между повторами растут экспоненциально от retry_delay до
+    retry_max_delay.
+
+    Атрибуты:
+        pool_size (int): Максимальное число соединений с API.
+        retry_delay (float): Пауза перед первым повтором в секундах.
+        retry_max_delay (float): Максимальная пауза между повторами в секундах.
+    """
+    name = 'pooled-requests'
+
+    def __init__(self, timeout, pool_size, retry_delay, retry_max_delay, **kwargs):
+        self.pool_size = pool_size
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        super().__init__(timeout=timeout, session=create_session(pool_size), **kwargs)
+
+    def reset_session(self):
+        """
+        Заменяет сессию новой. Вызывается в дочернем процессе после fork,
+        чтобы не использовать сокеты родительского процесса.
+        """
+        self._session = create_session(self.pool_size)
+        self._thread_local = threading.local()
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        started = time.perf_counter()
+        error = True
+        try:
+            response = super()._request_internal(method, url, headers, post_data, is_streaming)
+            error = response[1] >= 500
+            return response
+        finally:
+            endpoint = get_endpoint(method, url)
+            STRIPE_REQUEST_DURATION.observe((endpoint,), time.perf_counter() - started)
+            if error:
+                STRIPE_REQUEST_ERRORS.inc((endpoint,))
+
+    def _sleep_time_seconds(self, num_retries, response=None):
+        sleep_seconds = min(self.retry_delay * 2 ** (num_retries - 1), self.retry_max_delay)
+        sleep_seconds = sleep_seconds * (0.5 + random.random() / 2)
+        retry_after = self._retry_after_header(response) or 0
+        if retry_after <= self.MAX_RETRY_AFTER:
+            sleep_seconds = max(retry_after, sleep_seconds)
+        return sleep_seconds
+
+
+def configure_stripe_client():
+    """
+    Настраивает клиент stripe один раз при запуске процесса: ключ API,
+    общий пул соединений, таймауты и число повторов из настроек.
+    Возвращает установленный HTTP-клиент.
+    """
+    stripe.api_key = settings.STRIPE_API_KEY
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    stripe.default_http_client = PooledRequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        pool_size=settings.STRIPE_HTTP_POOL_SIZE,
+        retry_delay=settings.STRIPE_RETRY_DELAY,
+        retry_max_delay=settings.STRIPE_RETRY_MAX_DELAY,
+    )
+    return stripe.default_http_client
+
+
+def _reset_after_fork():
+    if isinstance(stripe.default_http_client, PooledRequestsClient):
+        stripe.default_http_client.reset_session()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import stripe
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик, имитирующий методы Stripe API, которые использует проект:
+    создание и изменение продуктов, создание цен и сессий оплаты.
+    Соединения поддерживаются открытыми (HTTP/1.1 keep-alive).
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        server = self.server
+        server.requests.append((self.path, params, self.headers.get('Idempotency-Key')))
+        server.connections.add(self.client_address)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_json(500, {'error': {'type': 'api_error', 'message': 'stub failure'}})
+            return
+
+        number = next(server.counter)
+        if self.path == '/v1/products':
+            body = {'id': f'prod_{number}', 'object': 'product', 'name': params.get('name')}
+        elif self.path.startswith('/v1/products/'):
+            body = {'id': self.path.rsplit('/', 1)[-1], 'object': 'product', 'name': params.get('name')}
+        elif self.path == '/v1/prices':
+            body = {'id': f'price_{number}', 'object': 'price', 'product': params.get('product'),
+                    'unit_amount': int(params.get('unit_amount', 0))}
+        elif self.path == '/v1/checkout/sessions':
+            body = {'id': f'cs_{number}', 'object': 'checkout.session',
+                    'url': f'https://checkout.stripe.test/cs_{number}'}
+        else:
+            self.send_error(404)
+            return
+
+        self.send_json(200, body)
+
+    def send_json(self, code, body):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StripeStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), StripeStubHandler)
+        self.latency = latency
+        self.counter = itertools.count(1)
+        self.requests = []
+        self.connections = set()
+        self.failures = 0
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def paths(self):
+        return [path for path, params, idempotency_key in self.requests]
+
+
+@contextmanager
+def stripe_stub(latency=0.0):
+    """
+    Запускает локальную замену Stripe API и направляет на нее клиент stripe.
+    Используется в тестах и замерах, latency добавляет задержку к каждому ответу.
+    """
+    server = StripeStubServer(latency=latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    previous = stripe.api_base, stripe.api_key
+    stripe.api_base, stripe.api_key = server.url, 'sk_test_stub'
+    try:
+        yield server
+    finally:
+        stripe.api_base, stripe.api_key = previous
+        server.shutdown()
+        server.server_close()
+
+
+def sign_webhook_payload(payload, secret, timestamp=None):
+    """
+    Возвращает заголовок Stripe-Signature для тела вебхука, как его подписывает Stripe.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
@@ -0,0 +1,275 @@
+import itertools
+import multiprocessing
+import random
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, time as datetime_time, timedelta
+from decimal import Decimal
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.utils import timezone
+
+from courses.models import Course, Lesson, Subscription
+from users.models import Payment, PaymentSummary, User
+
+PAYMENT_STATUSES = [Payment.STATUS_PAID] * 8 + [Payment.STATUS_OPEN, Payment.STATUS_FAILED]
+
+# Данные текущего этапа генерации, доступные функциям построения пачек
+_context = {}
+
+
+def zipf_cum_weights(count, exponent):
+    """
+    Возвращает накопленные веса распределения Ципфа для count элементов:
+    вес элемента с рангом r пропорционален 1 / r ** exponent.
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def restore_payment_dates(payments, dates):
+    """
+    Записывает созданным платежам сгенерированные даты через UPDATE ... FROM VALUES:
+    bulk_create заменяет значение поля payment_date с auto_now_add текущим временем.
+    """
+    table = Payment._meta.db_table
+    rows = [(payment.pk, date) for payment, date in zip(payments, dates)]
+    with connection.cursor() as cursor:
+        # Postgres ограничивает количество параметров запроса 65535
+        for offset in range(0, len(rows), 10000):
+            chunk = rows[offset:offset + 10000]
+            cursor.execute(
+                f'UPDATE {table} SET payment_date = v.payment_date::timestamptz '
+                f'FROM (VALUES {", ".join(["(%s, %s)"] * len(chunk))}) AS v (id, payment_date) '
+                f'WHERE {table}.id = v.id',
+                [value for row in chunk for value in row],
+            )
+
+
+def random_datetime(rng):
+    return _context['end'] - timedelta(seconds=rng.randrange(_context['days'] * 86400))
+
+
+def build_users(rng, start, stop):
+    hashes, prefix = _context['hashes'], _context['prefix']
+    for i in range(start, stop):
+        yield User(email=f'{prefix}{i}@example.com', password=hashes[i % len(hashes)],
+                   date_joined=random_datetime(rng), last_login=random_datetime(rng))
+
+
+def build_courses(rng, start, stop):
+    owners = rng.choices(_context['user_ids'], k=stop - start)
+    for i, owner_id in zip(range(start, stop), owners):
+        yield Course(title=f'{_context["prefix"]}course {i}', description='Синтетический курс', owner_id=owner_id)
+
+
+def build_lessons(rng, start, stop):
+    courses = rng.choices(_context['popular_courses'], cum_weights=_context['course_weights'], k=stop - start)
+    owners = _context['course_owners']
+    for i, course_id in zip(range(start, stop), courses):
+        yield Lesson(title=f'{_context["prefix"]}lesson {i}', course_id=course_id, owner_id=owners[course_id],
+                     video_url=f'https://www.youtube.com/watch?v={i}')
+
+
+def build_subscriptions(rng, start, stop):
+    """
+    Подписывает пользователей с номерами [start, stop) на различные курсы,
+    выбранные по популярности. Подписки распределяются между пользователями
+    поровну с точностью до одной.
+    """
+    user_ids, popular_courses, course_weights = _context['user_ids'], _context['popular_courses'], _context['course_weights']
+    per_user, extra = divmod(_context['subscriptions'], len(user_ids))
+    for i in range(start, stop):
+        count = min(per_user + (i < extra), len(popular_courses))
+        courses = set()
+        while len(courses) < count:
+            courses.update(rng.choices(popular_courses, cum_weights=course_weights, k=count - len(courses)))
+        for course_id in sorted(courses):
+            yield Subscription(user_id=user_ids[i], course_id=course_id)
+
+
+def build_payments(rng, start, stop):
+    count = stop - start
+    users = rng.choices(_context['user_ids'], k=count)
+    courses = rng.choices(_context['popular_courses'], cum_weights=_context['course_weights'], k=count)
+    lesson_ids, prefix = _context['lesson_ids'], _context['prefix']
+    for i, user_id, course_id in zip(range(start, stop), users, courses):
+        lesson_id = None
+        if lesson_ids and rng.random() < 0.5:
+            lesson_id, course_id = rng.choice(lesson_ids), None
+        method = rng.choice(('cash', 'transfer'))
+        yield Payment(
+            user_id=user_id,
+            course_id=course_id,
+            lesson_id=lesson_id,
+            payment_date=random_datetime(rng),
+            amount=Decimal(round(rng.lognormvariate(8, 1))) / 100 + 1,
+            payment_method=method,
+            stripe_session_id=f'cs_{prefix}{i}' if method == 'transfer' else None,
+            status=rng.choice(PAYMENT_STATUSES),
+        )
+
+
+STAGES = {
+    'users': (User, build_users),
+    'courses': (Course, build_courses),
+    'lessons': (Lesson, build_lessons),
+    'subscriptions': (Subscription, build_subscriptions),
+    'payments': (Payment, build_payments),
+}
+
+
+def set_context(context):
+    _context.clear()
+    _context.update(context)
+
+
+def init_worker(context):
+    django.setup()
+    set_context(context)
+
+
+def insert_chunk(task):
+    """
+    Строит и создает одну пачку объектов этапа. Генератор случайных чисел
+    пачки зависит только от seed, этапа и номера пачки, поэтому данные
+    не зависят от количества процессов и порядка выполнения пачек.
+    """
+    stage, chunk, start, stop = task
+    model, build = STAGES[stage]
+    rng = random.Random(f'{_context["seed"]}-{stage}-{chunk}')
+    objects = list(build(rng, start, stop))
+    if model is Payment:
+        dates = [payment.payment_date for payment in objects]
+    created = model.objects.bulk_create(objects)
+    if model is Payment and created:
+        restore_payment_dates(created, dates)
+    return len(created)
+
+
+class SyntheticDataGenerator:
+    """
+    Генератор синтетических данных для нагрузочных замеров.
+
+    Популярность курсов распределена по закону Ципфа: на несколько курсов
+    приходится большая часть уроков, подписок и платежей. Данные создаются
+    через bulk_create пачками по batch_size в processes процессах, в памяти
+    держатся только id пользователей, курсов и уроков. Хэши пароля считаются
+    заранее для password_pool солей и раздаются пользователям по кругу.
+    При одинаковых seed и параметрах генерируются одинаковые данные.
+
+    Атрибуты:
+        seed (int): Начальное значение генераторов случайных чисел.
+        batch_size (int): Количество объектов в одной пачке.
+        password (str): Пароль всех создаваемых пользователей.
+        password_pool (int): Количество различных хэшей пароля.
+        processes (int): Количество процессов; при 1 все выполняется в текущем процессе.
+        prefix (str): Префикс почты пользователей и названий курсов и уроков.
+        end_date (date): Дата последних платежей и входов.
+        days (int): Глубина истории платежей и входов в днях.
+        exponent (float): Показатель распределения Ципфа.
+        log (callable): Функция для вывода прогресса.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, password='password', password_pool=32, processes=None,
+                 prefix='synthetic-', end_date=None, days=365, exponent=1.1, log=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.password = password
+        self.password_pool = password_pool
+        self.processes = processes or multiprocessing.cpu_count()
+        self.prefix = prefix
+        self.end_date = end_date or timezone.localdate()
+        self.days = days
+        self.exponent = exponent
+        self.log = log or (lambda message: None)
+
+    @contextmanager
+    def executor(self, context):
+        """
+        Возвращает функцию map, выполняющую задачи в пуле процессов, или
+        в текущем процессе при processes=1. Процессы запускаются через spawn,
+        чтобы не унаследовать соединение с базой данных.
+        """
+        if self.processes == 1:
+            set_context(context)
+            yield map
+            return
+        connection.close()
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(context,)) as executor:
+            yield executor.map
+
+    def run_stage(self, stage, context, count, chunk_size=None):
+        chunk_size = chunk_size or self.batch_size
+        tasks = [
+            (stage, chunk, start, min(start + chunk_size, count))
+            for chunk, start in enumerate(range(0, count, chunk_size))
+        ]
+        started = time.perf_counter()
+        with self.executor(context) as run:
+            created = sum(run(insert_chunk, tasks))
+        seconds = time.perf_counter() - started
+        self.log(f'{stage}: {created} rows in {seconds:.1f}s ({created / max(seconds, 1e-9):.0f} rows/s)')
+        return created
+
+    def read_ids(self, queryset, field, prefix):
+        """
+        Возвращает id созданных объектов в порядке номеров, записанных
+        в поле field после prefix.
+        """
+        numbered = sorted(
+            (int(value[len(prefix):].split('@', 1)[0]), pk)
+            for value, pk in queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, 'id').iterator()
+        )
+        return [pk for _, pk in numbered]
+
+    def generate(self, users, courses, lessons, subscriptions, payments):
+        """
+        Создает данные и возвращает словарь с количеством строк по моделям.
+        """
+        rng = random.Random(self.seed)
+        letters = string.ascii_letters + string.digits
+        salts = [''.join(rng.choices(letters, k=22)) for _ in range(self.password_pool)]
+        context = {
+            'seed': self.seed,
+            'prefix': self.prefix,
+            'days': self.days,
+            'end': timezone.make_aware(datetime.combine(self.end_date, datetime_time.max)),
+            'subscriptions': subscriptions,
+        }
+
+        started = time.perf_counter()
+        with self.executor(context) as run:
+            context['hashes'] = list(run(make_password, itertools.repeat(self.password, len(salts)), salts))
+        self.log(f'password hashes: {len(salts)} in {time.perf_counter() - started:.1f}s')
+
+        counts = {'users': self.run_stage('users', context, users)}
+        context['user_ids'] = self.read_ids(User.objects.all(), 'email', self.prefix)
+        del context['hashes']
+
+        counts['courses'] = self.run_stage('courses', context, courses)
+        course_ids = self.read_ids(Course.objects.all(), 'title', f'{self.prefix}course ')
+        context['course_owners'] = dict(Course.objects.filter(id__in=course_ids).values_list('id', 'owner_id'))
+        popular_courses = course_ids[:]
+        rng.shuffle(popular_courses)
+        context['popular_courses'] = popular_courses
+        context['course_weights'] = zipf_cum_weights(len(popular_courses), self.exponent)
+
+        counts['lessons'] = self.run_stage('lessons', context, lessons)
+        context['lesson_ids'] = self.read_ids(Lesson.objects.all(), 'title', f'{self.prefix}lesson ')
+        del context['course_owners']
+
+        users_per_chunk = max(1, self.batch_size * users // max(subscriptions, 1))
+        counts['subscriptions'] = self.run_stage('subscriptions', context, users if subscriptions else 0,
+                                                 chunk_size=users_per_chunk)
+        counts['payments'] = self.run_stage('payments', context, payments)
+
+        started = time.perf_counter()
+        summaries = PaymentSummary.objects.reconcile(self.end_date - timedelta(days=self.days), self.end_date)
+        self.log(f'payment summaries: {summaries} rows in {time.perf_counter() - started:.1f}s')
+        self.user_ids, self.course_ids, self.lesson_ids = context['user_ids'], course_ids, context['lesson_ids']
+        return counts
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import stripe
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from courses.models import Course, Lesson
+from users.models import Payment, PaymentSummary, StripeEvent, StripeProduct
+from users.services import create_stripe_checkout_session, get_stripe_price, sync_stripe_product
+
+
+@shared_task
+def reconcile_payment_summaries(days=7):
+    """
+    Пересчитывает сводки платежей за последние days дней, исправляя
+    расхождения после массовых изменений платежей в обход сигналов.
+    """
+    date_to = timezone.localdate()
+    date_from = date_to - timedelta(days=days - 1)
+    return PaymentSummary.objects.reconcile(date_from, date_to)
+
+
+@shared_task
+def sync_stripe_catalog(course_ids=(), lesson_ids=()):
+    """
+    Создает или переименовывает продукты Stripe для переданных курсов и уроков,
+    чтобы при оплате оставалось только создание сессии.
+    """
+    products = StripeProduct.objects.filter(Q(course_id__in=course_ids) | Q(lesson_id__in=lesson_ids))
+    by_course = {product.course_id: product for product in products if product.course_id}
+    by_lesson = {product.lesson_id: product for product in products if product.lesson_id}
+    for course in Course.objects.filter(id__in=course_ids).only('id', 'title'):
+        sync_stripe_product(course=course, product=by_course.get(course.id))
+    for lesson in Lesson.objects.filter(id__in=lesson_ids).only('id', 'title'):
+        sync_stripe_product(lesson=lesson, product=by_lesson.get(lesson.id))
+
+
+@shared_task(bind=True, max_retries=5)
+def create_payment_checkout_session(self, payment_id):
+    """
+    Создает сессию оплаты Stripe для платежа в статусе pending.
+
+    Все запросы к Stripe передают ключи идемпотентности, производные от id
+    платежа, поэтому повторный запуск задачи не создает дубликатов.
+    Сетевые ошибки и превышение лимитов Stripe повторяются с экспоненциальной
+    задержкой, остальные ошибки, в том числе не связанные со Stripe, и
+    исчерпание повторов переводят платеж в статус failed.
+    """
+    payment = Payment.objects.select_related('course', 'lesson').filter(
+        pk=payment_id, status=Payment.STATUS_PENDING,
+    ).first()
+    if payment is None:
+        return
+    key = f'payment-{payment.id}'
+    try:
+        product_id, price_id = get_stripe_price(
+            payment.amount, course=payment.course, lesson=None if payment.course else payment.lesson,
+            idempotency_key=key,
+        )
+        session_id, checkout_url = create_stripe_checkout_session(
+            price_id, settings.STRIPE_SUCCESS_URL, settings.STRIPE_CANCEL_URL, idempotency_key=f'{key}-session',
+        )
+    except (stripe.APIConnectionError, stripe.RateLimitError) as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+        Payment.objects.filter(pk=payment.id, status=Payment.STATUS_PENDING).update(status=Payment.STATUS_FAILED)
+        raise
+    except Exception:
+        # Ошибки Stripe, кроме сетевых, и непредвиденные ошибки не исправятся
+        # повтором: платеж не должен навсегда остаться в статусе pending
+        Payment.objects.filter(pk=payment.id, status=Payment.STATUS_PENDING).update(status=Payment.STATUS_FAILED)
+        raise
+
+    Payment.objects.filter(pk=payment.id, status=Payment.STATUS_PENDING).update(
+        stripe_product_id=product_id,
+        stripe_price_id=price_id,
+        stripe_session_id=session_id,
+        stripe_checkout_url=checkout_url,
+        status=Payment.STATUS_OPEN,
+    )
+
+
+@shared_task
+def process_stripe_events(batch_size=None):
+    """
+    Применяет полученные события Stripe к статусам платежей пачками.
+
+    События выбираются в порядке создания с блокировкой SKIP LOCKED, поэтому
+    несколько запущенных задач не обрабатывают одно событие дважды. Для каждой
+    сессии берется последнее событие пачки, затем статусы обновляются одним
+    UPDATE на статус по stripe_session_id. Оплаченные платежи не меняются,
+    а переведенные в статус paid добавляются в сводки платежей.
+    Возвращает количество обработанных событий и обновленных платежей.
+    """
+    batch_size = batch_size or settings.STRIPE_EVENTS_BATCH_SIZE
+    processed = updated = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True).filter(processed_at__isnull=True)
+                .order_by('created', 'id').values_list('id', 'session_id', 'payment_status')[:batch_size]
+            )
+            if not events:
+                break
+            latest = {session_id: payment_status for _, session_id, payment_status in events}
+            sessions = defaultdict(list)
+            for session_id, payment_status in latest.items():
+                sessions[payment_status].append(session_id)
+            for payment_status, session_ids in sessions.items():
+                payments = Payment.objects.filter(stripe_session_id__in=session_ids).exclude(
+                    status__in=(Payment.STATUS_PAID, payment_status),
+                )
+                if payment_status != Payment.STATUS_PAID:
+                    updated += payments.update(status=payment_status)
+                    continue
+                # Оплаченные платежи попадают в сводку: UPDATE обходит сигналы,
+                # поэтому переводимые платежи блокируются и учитываются явно
+                rows = list(payments.select_for_update().order_by('id').values_list(
+                    'id', 'payment_date', 'course_id', 'lesson_id', 'payment_method', 'amount',
+                ))
+                updated += Payment.objects.filter(id__in=[row[0] for row in rows]).update(status=payment_status)
+                PaymentSummary.objects.apply_payments(row[1:] for row in rows)
+            StripeEvent.objects.filter(id__in=[event[0] for event in events]).update(processed_at=timezone.now())
+        processed += len(events)
+        if len(events) < batch_size:
+            break
+    return {'events': processed, 'updated': updated}
+
+
+@shared_task
+def purge_stripe_events(days=30):
+    """
+    Удаляет обработанные события старше days дней. Stripe повторяет доставку
+    не дольше трех дней, поэтому более старые события не нужны для дедупликации.
+    """
+    received_before = timezone.now() - timedelta(days=days)
+    deleted, _ = StripeEvent.objects.filter(processed_at__isnull=False, received_at__lt=received_before).delete()
+    return deleted
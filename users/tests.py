@@ -1,3 +1,508 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from importlib import import_module
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import stripe
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from config.celery import app as celery_app
+from config.metrics import registry
+from courses.models import Course, Lesson
+from courses.tasks import INACTIVE_USERS_PROGRESS_KEY, check_inactive_users
+from users.models import User, Payment, PaymentSummary, StripeEvent, StripeProduct
+from users.serializers import UserSerializer
+from users.services import create_stripe_product, update_stripe_product
+from users.stripe_client import PooledRequestsClient
+from users.synthetic_data import SyntheticDataGenerator
+from users.stripe_stub import sign_webhook_payload, stripe_stub
+from users.tasks import create_payment_checkout_session, process_stripe_events, sync_stripe_catalog
+
+
+class TokenRolesTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User(email='moder@test.ru')
+        self.user.set_password('123')
+        self.user.save()
+        self.user.groups.add(Group.objects.create(name='moderators'))
+        owner = User.objects.create(email='owner@test.ru', password='123')
+        course = Course.objects.create(title='test course', owner=owner)
+        self.lesson = Lesson.objects.create(title='test lesson', course=course,
+                                            video_url='https://www.youtube.com/123', owner=owner)
+
+    def authenticate(self):
+        response = self.client.post('/users/token/', {'email': 'moder@test.ru', 'password': '123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    @override_settings(ROLES_FROM_TOKEN=True)
+    def test_roles_from_token(self):
+        """Роли берутся из claim токена без запроса к группам"""
+        self.authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/lesson/{self.lesson.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('auth_group' in query['sql'] for query in queries))
+
+    def test_roles_from_database(self):
+        """Без ROLES_FROM_TOKEN роли запрашиваются из базы"""
+        self.authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/lesson/{self.lesson.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum('auth_group' in query['sql'] for query in queries), 1)
+
+
+@override_settings(JWT_STATELESS_AUTH=True)
+class StatelessAuthenticationTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = User(email='owner@test.ru', first_name='Owner')
+        self.user.set_password('123')
+        self.user.save()
+        course = Course.objects.create(title='test course', owner=self.user)
+        self.lesson = Lesson.objects.create(title='test lesson', course=course,
+                                            video_url='https://www.youtube.com/123', owner=self.user)
+        response = self.client.post('/users/token/', {'email': 'owner@test.ru', 'password': '123'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def test_user_is_not_loaded(self):
+        """Пользователь собирается из токена без запроса к таблице пользователей"""
+        self.client.get(f'/lesson/{self.lesson.id}/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/lesson/{self.lesson.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('"users_user"' in query['sql'] for query in queries))
+
+    def test_deferred_fields_are_loaded_on_access(self):
+        """Поля, отсутствующие в токене, загружаются из базы при обращении"""
+        request = self.client.get(f'/lesson/{self.lesson.id}/').wsgi_request
+        user = request.user
+        self.assertEqual(user.email, 'owner@test.ru')
+        self.assertEqual(user.first_name, 'Owner')
+
+    def test_deactivated_user_is_rejected(self):
+        """Деактивация через check_inactive_users сразу отключает доступ по токену"""
+        self.client.get(f'/lesson/{self.lesson.id}/')
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - timedelta(days=60))
+        check_inactive_users()
+        response = self.client.get(f'/lesson/{self.lesson.id}/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CheckInactiveUsersTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        old = timezone.now() - timedelta(days=60)
+        self.stale = [User.objects.create(email=f'stale{i}@test.ru', last_login=old) for i in range(3)]
+        self.never_logged_in = User.objects.create(email='never@test.ru')
+        User.objects.filter(pk=self.never_logged_in.pk).update(date_joined=old)
+        self.fresh = User.objects.create(email='fresh@test.ru', last_login=timezone.now())
+        self.new = User.objects.create(email='new@test.ru')
+
+    def test_bulk_deactivation(self):
+        """Неактивные пользователи деактивируются пачками по диапазонам id"""
+        result = check_inactive_users(chunk_size=2)
+        self.assertEqual(result['updated'], 4)
+        self.assertEqual(sum(result['chunks']), 4)
+        self.assertGreater(len(result['chunks']), 1)
+        self.assertEqual(
+            set(User.objects.filter(is_active=False).values_list('email', flat=True)),
+            {'stale0@test.ru', 'stale1@test.ru', 'stale2@test.ru', 'never@test.ru'},
+        )
+        self.assertIsNone(cache.get(INACTIVE_USERS_PROGRESS_KEY))
+
+    def test_single_update_per_chunk(self):
+        """Каждая пачка деактивируется одним UPDATE по id, выбранным с блокировкой"""
+        with CaptureQueriesContext(connection) as queries:
+            result = check_inactive_users(chunk_size=1000)
+        user_queries = [query['sql'] for query in queries if 'users_user' in query['sql']]
+        self.assertEqual(result['chunks'], [4])
+        self.assertEqual(len(user_queries), 3)
+        self.assertIn('"last_login"', user_queries[1])
+        self.assertTrue(user_queries[1].endswith('FOR UPDATE'))
+        self.assertTrue(user_queries[2].startswith('UPDATE'))
+        self.assertNotIn('"last_login"', user_queries[2])
+
+    def test_resume_from_saved_progress(self):
+        """Повторный запуск продолжает с сохраненного id"""
+        cache.set(INACTIVE_USERS_PROGRESS_KEY, self.stale[2].pk)
+        result = check_inactive_users()
+        self.assertEqual(result['updated'], 2)
+        self.assertTrue(User.objects.get(pk=self.stale[0].pk).is_active)
+        self.assertFalse(User.objects.get(pk=self.stale[2].pk).is_active)
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+        for amount in ('10.00', '20.50', '30.00'):
+            Payment.objects.create(user=self.user, course=self.course, amount=Decimal(amount), payment_method='cash')
+        Payment.objects.create(user=self.user, amount=Decimal('99.00'), payment_method='transfer')
+
+    def test_export_ndjson_with_filters(self):
+        """Выгрузка в NDJSON учитывает фильтры и сортировку списка платежей"""
+        response = self.client.get('/users/payment/export/', {
+            'export_format': 'ndjson', 'course': self.course.id, 'ordering': '-amount',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['30.00', '20.50', '10.00'])
+        self.assertEqual(rows[0]['course'], self.course.id)
+
+    def test_export_csv_gzip(self):
+        """Выгрузка в CSV сжимается gzip, если клиент его принимает"""
+        response = self.client.get('/users/payment/export/', {'ordering': 'amount'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]['amount'], '99.00')
+        self.assertEqual(rows[-1]['payment_method'], 'transfer')
+
+
+class PaymentSummaryTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+
+    def summary_rows(self):
+        return sorted(PaymentSummary.objects.filter(payments_count__gt=0).values_list(
+            'day', 'course', 'lesson', 'payment_method', 'total_amount', 'payments_count'))
+
+    def test_summary_is_maintained_incrementally(self):
+        """Сводка обновляется при создании, изменении и удалении платежей и совпадает с пересчетом"""
+        first = Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'),
+                                       payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        Payment.objects.create(user=self.user, course=self.course, amount=Decimal('20.00'),
+                               payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        third = Payment.objects.create(user=self.user, amount=Decimal('5.00'), payment_method='transfer',
+                                       status=Payment.STATUS_PAID)
+        first.amount = Decimal('15.00')
+        first.payment_method = 'transfer'
+        first.save()
+        third.delete()
+
+        incremental = self.summary_rows()
+        self.assertEqual([(row[3], row[4], row[5]) for row in incremental],
+                         [('cash', Decimal('20.00'), 1), ('transfer', Decimal('15.00'), 1)])
+        today = timezone.localdate()
+        PaymentSummary.objects.reconcile(today, today)
+        self.assertEqual(self.summary_rows(), incremental)
+
+    def test_cascade_delete_of_course(self):
+        """Каскадное удаление курса с платежами не создает строк сводки со ссылкой на него"""
+        Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        self.course.delete()
+        self.assertFalse(PaymentSummary.objects.exists())
+
+    def test_backfill_migration(self):
+        """Миграция 0011 пересчитывает сводку по всей истории платежей"""
+        old = Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        Payment.objects.filter(pk=old.pk).update(payment_date=timezone.now() - timedelta(days=400))
+        Payment.objects.create(user=self.user, course=self.course, amount=Decimal('2.50'), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        PaymentSummary.objects.all().delete()
+        migration = import_module('users.migrations.0011_backfill_payment_summaries')
+        migration.backfill_payment_summaries(django_apps, None)
+        self.assertEqual([(row[3], row[4], row[5]) for row in self.summary_rows()],
+                         [('cash', Decimal('10.00'), 1), ('cash', Decimal('2.50'), 1)])
+
+    def test_revenue_endpoint(self):
+        """Эндпоинт выручки возвращает суммы за диапазон дат"""
+        Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        Payment.objects.create(user=self.user, course=self.course, amount=Decimal('2.50'), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+        today = timezone.localdate().isoformat()
+        response = self.client.get('/users/payment/revenue/', {'day__gte': today, 'day__lte': today,
+                                                               'course': self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_amount'], Decimal('12.50'))
+        self.assertEqual(response.data['payments_count'], 2)
+        self.assertEqual(len(response.data['days']), 1)
+
+    def test_only_paid_payments_are_counted(self):
+        """Неоплаченные и неуспешные платежи не входят в сводку, оплата добавляет платеж в нее"""
+        pending = Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'),
+                                         payment_method='transfer')
+        failed = Payment.objects.create(user=self.user, course=self.course, amount=Decimal('7.00'),
+                                        payment_method='transfer', status=Payment.STATUS_PAID)
+        failed.status = Payment.STATUS_FAILED
+        failed.save()
+        self.assertEqual(self.summary_rows(), [])
+        pending.status = Payment.STATUS_PAID
+        pending.save()
+        incremental = self.summary_rows()
+        self.assertEqual([(row[3], row[4], row[5]) for row in incremental], [('transfer', Decimal('10.00'), 1)])
+        today = timezone.localdate()
+        PaymentSummary.objects.reconcile(today, today)
+        self.assertEqual(self.summary_rows(), incremental)
+
+
+class StripeStubTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = User.objects.create(email='test@test.ru', password='123')
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title='test course', owner=self.user)
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def tearDown(self) -> None:
+        celery_app.conf.task_always_eager = self.always_eager
+
+    def create_payment(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/users/payment/create/', {
+                'user': self.user.id, 'course': self.course.id, 'amount': amount, 'payment_method': 'transfer',
+            })
+
+
+class StripeCatalogTestCase(StripeStubTestCase):
+
+    def test_product_and_price_are_reused(self):
+        """Повторная оплата курса на ту же сумму выполняет только создание сессии"""
+        with stripe_stub() as stub:
+            self.assertEqual(self.create_payment('100.00').status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.create_payment('100.00').status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.create_payment('150.00').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(stub.paths(), [
+            '/v1/products', '/v1/prices', '/v1/checkout/sessions',
+            '/v1/checkout/sessions',
+            '/v1/prices', '/v1/checkout/sessions',
+        ])
+        self.assertEqual(Payment.objects.filter(stripe_product_id='prod_1').count(), 3)
+
+    def test_sync_catalog_creates_and_renames_products(self):
+        """Синхронизация каталога создает продукты и обновляет их названия"""
+        with stripe_stub() as stub:
+            sync_stripe_catalog(course_ids=[self.course.id])
+            Course.objects.filter(pk=self.course.pk).update(title='renamed')
+            sync_stripe_catalog(course_ids=[self.course.id])
+            sync_stripe_catalog(course_ids=[self.course.id])
+        product = StripeProduct.objects.get(course=self.course)
+        self.assertEqual(product.name, 'renamed')
+        self.assertEqual(stub.paths(), ['/v1/products', f'/v1/products/{product.product_id}'])
+
+
+class PaymentCheckoutTestCase(StripeStubTestCase):
+
+    def test_payment_is_created_pending(self):
+        """Платеж создается сразу в статусе pending без запросов к Stripe"""
+        with stripe_stub() as stub:
+            response = self.client.post('/users/payment/create/', {
+                'user': self.user.id, 'course': self.course.id, 'amount': '10.00', 'payment_method': 'transfer',
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Payment.STATUS_PENDING)
+        self.assertEqual(stub.requests, [])
+        response = self.client.get(f'/users/payment/{response.data["id"]}/status/')
+        self.assertEqual(response.data['status'], Payment.STATUS_PENDING)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_checkout_session_is_created_by_task(self):
+        """Задача создает сессию с ключами идемпотентности, статус доступен через эндпоинт"""
+        with stripe_stub() as stub:
+            payment_id = self.create_payment('10.00').data['id']
+            create_payment_checkout_session(payment_id)
+        self.assertEqual([key for path, params, key in stub.requests], [
+            f'payment-{payment_id}-product', f'payment-{payment_id}-price', f'payment-{payment_id}-session',
+        ])
+        response = self.client.get(f'/users/payment/{payment_id}/status/')
+        self.assertEqual(response.data['status'], Payment.STATUS_OPEN)
+        self.assertFalse(response.has_header('Retry-After'))
+        self.assertTrue(response.data['stripe_checkout_url'].startswith('https://checkout.stripe.test/'))
+
+    def test_unexpected_error_fails_payment(self):
+        """Непредвиденная ошибка при создании сессии переводит платеж в статус failed"""
+        payment = Payment.objects.create(user=self.user, course=self.course, amount=Decimal('10.00'),
+                                         payment_method='transfer')
+        with patch('users.tasks.get_stripe_price', side_effect=KeyError('price')):
+            with self.assertRaises(KeyError):
+                create_payment_checkout_session(payment.id)
+        self.assertEqual(Payment.objects.get(pk=payment.id).status, Payment.STATUS_FAILED)
+
+    def test_payment_without_course_or_lesson(self):
+        """Платеж без курса и урока отклоняется"""
+        response = self.client.post('/users/payment/create/', {
+            'user': self.user.id, 'amount': '10.00', 'payment_method': 'transfer',
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_status_of_foreign_payment(self):
+        """Статус чужого платежа недоступен"""
+        other = User.objects.create(email='other@test.ru', password='123')
+        payment = Payment.objects.create(user=other, course=self.course, amount=Decimal('1.00'),
+                                         payment_method='cash')
+        response = self.client.get(f'/users/payment/{payment.id}/status/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StripeClientTestCase(TestCase):
+    def setUp(self) -> None:
+        registry.reset()
+
+    def test_connections_are_reused_and_measured(self):
+        """Вызовы Stripe идут через общий пул keep-alive соединений и попадают в метрики"""
+        self.assertIsInstance(stripe.default_http_client, PooledRequestsClient)
+        with stripe_stub() as stub:
+            product_id = create_stripe_product('first')
+            create_stripe_product('second')
+            update_stripe_product(product_id, 'renamed')
+        self.assertEqual(len(stub.connections), 1)
+        metrics = registry.render()
+        self.assertIn('stripe_request_duration_seconds_count{endpoint="POST /v1/products"} 2', metrics)
+        self.assertIn('stripe_request_duration_seconds_count{endpoint="POST /v1/products/{id}"} 1', metrics)
+        self.assertNotIn('stripe_request_errors_total{', metrics)
+
+    @patch.object(stripe, 'max_network_retries', 2)
+    def test_server_errors_are_retried(self):
+        """Ошибки сервера повторяются с тем же ключом идемпотентности, но не больше заданного числа раз"""
+        with patch.object(stripe.default_http_client, 'retry_delay', 0.001), stripe_stub() as stub:
+            stub.failures = 2
+            self.assertTrue(create_stripe_product('course', idempotency_key='retry-key'))
+            stub.failures = 3
+            with self.assertRaises(stripe.error.APIError):
+                create_stripe_product('course')
+        self.assertEqual([key for path, params, key in stub.requests][:3], ['retry-key'] * 3)
+        self.assertEqual(len(stub.requests), 6)
+        metrics = registry.render()
+        self.assertIn('stripe_request_duration_seconds_count{endpoint="POST /v1/products"} 6', metrics)
+        self.assertIn('stripe_request_errors_total{endpoint="POST /v1/products"} 5', metrics)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        user = User.objects.create(email='test@test.ru', password='123')
+        course = Course.objects.create(title='test course', owner=user)
+        self.payments = [
+            Payment.objects.create(user=user, course=course, amount=Decimal('10.00'), payment_method='transfer',
+                                   stripe_session_id=f'cs_{i}', status=Payment.STATUS_OPEN)
+            for i in range(3)
+        ]
+
+    def send_event(self, event_id, event_type, session_id, secret='whsec_test'):
+        payload = json.dumps({
+            'id': event_id, 'type': event_type, 'created': 1700000000 + int(event_id.rsplit('_', 1)[-1]),
+            'data': {'object': {'id': session_id, 'payment_status': 'paid'}},
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/users/payment/webhook/', payload, content_type='application/json',
+                                    HTTP_STRIPE_SIGNATURE=sign_webhook_payload(payload, secret))
+
+    def test_invalid_signature_is_rejected(self):
+        """Событие с неверной подписью отклоняется и не сохраняется"""
+        response = self.send_event('evt_1', 'checkout.session.completed', 'cs_0', secret='whsec_other')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_events_are_deduplicated_and_applied_in_batch(self):
+        """Всплеск событий ставит одну задачу, повторы отбрасываются, статусы обновляются пачкой,
+        в выручку попадают только оплаченные платежи"""
+        with patch.object(process_stripe_events, 'apply_async') as apply_async:
+            for event in (('evt_1', 'checkout.session.completed', 'cs_0'),
+                          ('evt_2', 'checkout.session.completed', 'cs_1'),
+                          ('evt_1', 'checkout.session.completed', 'cs_0'),
+                          ('evt_3', 'checkout.session.expired', 'cs_2'),
+                          ('evt_4', 'customer.created', 'cus_1')):
+                self.assertEqual(self.send_event(*event).status_code, status.HTTP_200_OK)
+        apply_async.assert_called_once()
+        self.assertEqual(StripeEvent.objects.count(), 3)
+
+        with self.assertNumQueries(8):
+            self.assertEqual(process_stripe_events(), {'events': 3, 'updated': 3})
+        self.assertEqual([payment.status for payment in Payment.objects.order_by('id')],
+                         [Payment.STATUS_PAID, Payment.STATUS_PAID, Payment.STATUS_FAILED])
+        self.assertEqual(list(PaymentSummary.objects.values_list('total_amount', 'payments_count')),
+                         [(Decimal('20.00'), 2)])
+
+        self.send_event('evt_5', 'checkout.session.expired', 'cs_0')
+        self.assertEqual(process_stripe_events(), {'events': 1, 'updated': 0})
+        self.assertEqual(Payment.objects.get(pk=self.payments[0].pk).status, Payment.STATUS_PAID)
+        self.assertEqual(PaymentSummary.objects.get().payments_count, 2)
+
+
+@override_settings(USER_PAYMENTS_EMBED_LIMIT=2)
+class UserListTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.users = [User.objects.create(email=f'user{i}@test.ru', password='123') for i in range(3)]
+        course = Course.objects.create(title='test course', owner=self.users[0])
+        for user in self.users:
+            Payment.objects.create(user=user, course=course, amount=Decimal('5.00'), payment_method='cash',
+                                   status=Payment.STATUS_FAILED)
+            for amount in ('10.00', '20.00', '30.00'):
+                Payment.objects.create(user=user, course=course, amount=Decimal(amount), payment_method='cash',
+                                       status=Payment.STATUS_PAID)
+
+    def test_list_is_paginated_with_summary(self):
+        """Список пользователей разбит на страницы, сводка оплаченных платежей считается без запроса на пользователя"""
+        with self.assertNumQueries(4):
+            response = self.client.get('/users/users/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        user = response.data['results'][0]
+        self.assertNotIn('payments', user)
+        self.assertEqual(user['payments_summary']['count'], 3)
+        self.assertEqual(user['payments_summary']['total'], '60.00')
+        self.assertEqual(UserSerializer(self.users[0]).data['payments_summary'], user['payments_summary'])
+
+    def test_expanded_payments_are_limited(self):
+        """При ?expand=payments встраиваются только последние платежи одним запросом"""
+        with self.assertNumQueries(5):
+            response = self.client.get('/users/users/', {'expand': 'payments'})
+        for user in response.data['results']:
+            self.assertEqual([payment['amount'] for payment in user['payments']], ['30.00', '20.00'])
+            self.assertEqual(user['payments_summary']['count'], 3)
+
+
+class SyntheticDataTestCase(TestCase):
+
+    def generate(self, prefix):
+        generator = SyntheticDataGenerator(seed=7, batch_size=50, password_pool=2, processes=1, prefix=prefix,
+                                           end_date=timezone.localdate())
+        counts = generator.generate(users=40, courses=10, lessons=30, subscriptions=100, payments=200)
+        payments = Payment.objects.filter(user__email__startswith=prefix).order_by('id').values_list(
+            'amount', 'payment_method', 'status', 'payment_date',
+        )
+        return counts, list(payments)
+
+    def test_generation_is_deterministic(self):
+        """Генератор создает заданное количество строк, одинаковых при одном seed"""
+        counts, payments = self.generate('first-')
+        self.assertEqual(counts, {'users': 40, 'courses': 10, 'lessons': 30, 'subscriptions': 100, 'payments': 200})
+        self.assertEqual(self.generate('second-')[1], payments)
+        self.assertTrue(Payment._meta.get_field('payment_date').auto_now_add)
+        self.assertTrue(User.objects.get(email='first-0@example.com').check_password('password'))
+        popularity = Course.objects.filter(title__startswith='first-').annotate(
+            payments_count=Count('payment'),
+        ).order_by('-payments_count').values_list('payments_count', flat=True)
+        self.assertGreater(popularity[0], 3 * popularity[len(popularity) - 1])
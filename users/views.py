@@ -1,13 +1,28 @@
+import json
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Prefetch, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, generics, permissions
+from rest_framework import viewsets, generics, permissions, status
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from users.models import User, Payment
+from users.exports import EXPORT_FIELDS, EXPORT_FORMATS, encode_chunks
+from users.models import User, Payment, PaymentSummary, StripeEvent
+from users.paginators import UserPaginator
 from users.permissions import IsOwner, IsModer
-from users.serializers import UserSerializer, PaymentSerializer
-from users.services import create_stripe_product, create_stripe_price, create_stripe_checkout_session
+from users.services import schedule_stripe_events_processing
+from users.serializers import UserSerializer, PaymentSerializer, PaymentStatusSerializer
+from users.tasks import create_payment_checkout_session
 
 
 class UserRegisterView(generics.CreateAPIView):
@@ -49,10 +64,37 @@ class UserViewSet(viewsets.ModelViewSet):
 
     Атрибуты:
         serializer_class: Класс сериализатора для объекта пользователя.
-        queryset: QuerySet для всех объектов пользователя.
+        pagination_class: Класс пагинации для списка пользователей.
     """
     serializer_class = UserSerializer
-    queryset = User.objects.all()
+    pagination_class = UserPaginator
+
+    def get_queryset(self):
+        """
+        Возвращает пользователей с подгруженными группами и правами.
+
+        Сводка оплаченных платежей считается коррелированными подзапросами
+        только для пользователей страницы. Платежи подгружаются одним запросом с оконной
+        функцией, ограничивающей их USER_PAYMENTS_EMBED_LIMIT последними
+        на пользователя, и только при ?expand=payments.
+        """
+        if getattr(self, 'swagger_fake_view', False):
+            return User.objects.none()
+        fields = self.get_serializer().fields
+        queryset = User.objects.order_by('pk').prefetch_related('groups', 'user_permissions')
+        if 'payments_summary' in fields:
+            payments = Payment.objects.filter(user=OuterRef('pk'), status=Payment.STATUS_PAID).order_by().values('user')
+            queryset = queryset.annotate(
+                payments_count=Coalesce(Subquery(payments.annotate(value=Count('id')).values('value')), 0),
+                payments_total=Subquery(payments.annotate(value=Sum('amount')).values('value')),
+                last_payment_date=Subquery(payments.annotate(value=Max('payment_date')).values('value')),
+            )
+        if 'payments' in fields:
+            latest = Payment.objects.annotate(
+                rank=Window(RowNumber(), partition_by=F('user'), order_by=(F('payment_date').desc(), F('pk').desc())),
+            ).filter(rank__lte=settings.USER_PAYMENTS_EMBED_LIMIT).order_by('-payment_date', '-pk')
+            queryset = queryset.prefetch_related(Prefetch('payments', queryset=latest))
+        return queryset
 
 
 class PaymentListAPIView(generics.ListAPIView):
@@ -73,6 +115,88 @@ class PaymentListAPIView(generics.ListAPIView):
     filterset_fields = ('lesson', 'course', 'payment_method', 'amount')
 
 
+class PaymentExportAPIView(generics.GenericAPIView):
+    """
+    APIView для потоковой выгрузки платежей в CSV или NDJSON.
+
+    Принимает те же параметры фильтрации и сортировки, что и список платежей,
+    а также ?export_format=csv|ndjson. Строки читаются с сервера базы данных
+    курсором порциями по PAYMENT_EXPORT_CHUNK_SIZE и сразу отдаются клиенту,
+    поэтому потребление памяти не зависит от количества платежей. Если клиент
+    принимает gzip, ответ сжимается на лету.
+
+    Атрибуты:
+        queryset: QuerySet для всех объектов платежа.
+        filter_backends: Бэкенды для фильтрации и сортировки платежей.
+        ordering_fields: Поля, по которым можно сортировать платежи.
+        filterset_fields: Поля, по которым можно фильтровать платежи.
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    queryset = Payment.objects.all()
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    ordering_fields = ['payment_date', 'amount']
+    filterset_fields = ('lesson', 'course', 'payment_method', 'amount')
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': f'Допустимые значения: {", ".join(EXPORT_FORMATS)}'})
+        lines, content_type = EXPORT_FORMATS[export_format]
+
+        chunk_size = settings.PAYMENT_EXPORT_CHUNK_SIZE
+        rows = self.filter_queryset(self.get_queryset()).values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+        compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+
+        response = StreamingHttpResponse(
+            encode_chunks(lines(rows, EXPORT_FIELDS), chunk_size, compress=compress),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="payments.{export_format}"'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
+class PaymentRevenueAPIView(generics.GenericAPIView):
+    """
+    APIView для получения выручки по сводкам платежей.
+
+    Параметры: day__gte, day__lte, course, lesson, payment_method.
+    Возвращает общую сумму и количество платежей, а также разбивку по дням.
+    Данные берутся из сводной таблицы, поэтому время ответа зависит
+    от количества дней в диапазоне, а не от количества платежей.
+
+    Атрибуты:
+        queryset: QuerySet для всех сводок платежей.
+        filter_backends: Бэкенды для фильтрации сводок.
+        filterset_fields: Поля, по которым можно фильтровать сводки.
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    queryset = PaymentSummary.objects.all()
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'day': ['gte', 'lte'],
+        'course': ['exact'],
+        'lesson': ['exact'],
+        'payment_method': ['exact'],
+    }
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        days = queryset.values('day').annotate(
+            total_amount=Sum('total_amount'), payments_count=Sum('payments_count'),
+        ).order_by('day')
+        days = [day for day in days if day['payments_count']]
+        return Response({
+            'total_amount': sum((day['total_amount'] for day in days), Decimal('0')),
+            'payments_count': sum(day['payments_count'] for day in days),
+            'days': days,
+        })
+
+
 class PaymentRetrieveAPIView(generics.RetrieveAPIView):
     """
     APIView для получения одного платежа.
@@ -127,37 +251,78 @@ class PaymentCreateAPIView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         """
-        Сохраняет новый платеж с текущим пользователем в качестве владельца.
+        Сохраняет новый платеж в статусе pending с текущим пользователем
+        в качестве владельца. Сессия оплаты Stripe создается задачей Celery
+        после фиксации транзакции, ссылку на оплату клиент получает через
+        эндпоинт статуса платежа.
 
         Аргументы:
             serializer: Сериализатор с данными платежа.
         """
-        payment = serializer.save(user=self.request.user)
-        course = payment.course
-        lesson = payment.lesson
+        if not serializer.validated_data.get('course') and not serializer.validated_data.get('lesson'):
+            raise ValidationError("Оплата должна быть связана с курсом или уроком")
+        payment = serializer.save(user=self.request.user, status=Payment.STATUS_PENDING)
+        transaction.on_commit(lambda: create_payment_checkout_session.delay(payment.id))
+
+
+class PaymentStatusAPIView(generics.RetrieveAPIView):
+    """
+    APIView для получения статуса платежа и ссылки на оплату.
+
+    Ответ возвращается сразу, без ожидания на сервере, чтобы не занимать
+    синхронный воркер. Пока сессия оплаты не создана (статус pending),
+    заголовок Retry-After сообщает клиенту, через сколько секунд повторить запрос.
+
+    Атрибуты:
+        serializer_class: Класс сериализатора статуса платежа.
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    serializer_class = PaymentStatusSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Возвращает только платежи текущего пользователя.
+        """
+        return Payment.objects.filter(user_id=self.request.user.pk).only('id', 'status', 'stripe_checkout_url')
 
-        if course:
-            product_name = course.title
-        elif lesson:
-            product_name = lesson.title
-        else:
-            raise ValueError("Оплата должна быть связана с курсом или уроком")
+    def retrieve(self, request, *args, **kwargs):
+        payment = self.get_object()
+        response = Response(self.get_serializer(payment).data)
+        if payment.status == Payment.STATUS_PENDING:
+            response['Retry-After'] = str(settings.PAYMENT_STATUS_RETRY_AFTER)
+        return response
 
-        product_id = create_stripe_product(product_name)
-        price_id = create_stripe_price(product_id, payment.amount)
 
-        success_url = "http://127.0.0.1:8000/courses/"
-        cancel_url = "http://127.0.0.1:8000/courses/"
+class StripeWebhookAPIView(APIView):
+    """
+    APIView для приема вебхуков Stripe.
 
-        session_id, checkout_url = create_stripe_checkout_session(price_id, success_url, cancel_url)
+    Проверяет подпись события и сохраняет событие, меняющее статус платежа,
+    одним INSERT; повторная доставка того же события игнорируется. Статусы
+    платежей обновляет задача process_stripe_events, поэтому ответ Stripe
+    отправляется сразу, а всплеск событий обрабатывается пачками.
 
-        payment.stripe_product_id = product_id
-        payment.stripe_price_id = price_id
-        payment.stripe_session_id = session_id
-        payment.stripe_checkout_url = checkout_url
-        payment.save()
+    Атрибуты:
+        authentication_classes: Классы аутентификации (подлинность проверяется подписью).
+        permission_classes: Разрешения для доступа к этому представлению.
+    """
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
 
-        return Response({
-            'payment': PaymentSerializer(payment).data,
-            'checkout_url': checkout_url
-        })
+    def post(self, request, *args, **kwargs):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        payload = request.body.decode()
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET,
+                settings.STRIPE_WEBHOOK_TOLERANCE,
+            )
+            event = StripeEvent.from_payload(json.loads(payload))
+        except (stripe.SignatureVerificationError, ValueError, KeyError, TypeError, AttributeError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if event is not None:
+            StripeEvent.objects.bulk_create([event], ignore_conflicts=True)
+            transaction.on_commit(schedule_stripe_events_processing)
+        return Response(status=status.HTTP_200_OK)